@@ -3,173 +3,223 @@
 # author: Luca Manini (luca.manini@liceodavincitn.it)
 
 import os
-import csv
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import logging
-logging.basicConfig(level=logging.DEBUG,
-                    format="%(levelname)s: %(message)s")
 debug = logging.debug
 
-from odv import (
-    Record, get_encoding, csv_to_records,
-    DAYS_INDEX, START_SHIFT, START_TIMES,
-    )
+from odv import setup_logging, iter_records, pop_profile, stage, class_codes
 
 progname = os.path.basename(__file__)
 
-def main(csv_in, base_tables_outdir="./out"):
-
-    recs = tuple(csv_to_records(csv_in))
-
-    # subjects (materie) ----------------------------------------
-
-    mat_dic = dict()
-    for r in recs:
-        mat_dic[r.MAT_COD] = r.MAT_NOME
-
-    # Il file mat_out.txt contiene una riga per ciascuna materia con
-    # il codice della materia, un segno di uguale come separatore e
-    # poi il nome per esteso della materia (come compare nel file di
-    # export di EDT). Qualcosa del tipo:
-    #
-    # DIR = Diritto ed Economia
-    # DIS = Disegno e Storia dell'arte
-    # FIL = Filosofia
-    # ING = Lingua e Cultura Straniera Inglese
-    #
-    # Questo file può essere usato come base di partenza per creare un
-    # altro file da usare come dizionario delle "abbreviazioni".
-    # Qualcosa del tipo:
-    #
-    # DIR = Dir. Eco.
-    # DIS = Dis. Arte
-    # FIL = Filosofia
-    # ING = Inglese
-
-    mat_file = os.path.join(base_tables_outdir, "mat_out.txt")
-    with open(mat_file, "w") as out:
-        for k,v in sorted(mat_dic.items()):
-            out.write(f"{k} = {v}\n")
-
-    # classes --------------------------------------------------
-
-    # class "codes" can have different "formats":
-    #
-    # 1As  = first year, group A, type s (plain old fashion)
-    # 1Bsa = first year, group B, type sa (the almost good one)
-    #
-    # Because there is no Asa not Bs, I'll drop the suffix
-    #
-    # 2G/H   SPA = second year, TWO separate classes (G/H) doing SPANISH
-    # 4G/H/R SPA = second year, THREE separate classes (G/H/R) doing SPANISH
-    # this line is equivalent (and will be transformed into) TWO lines
-
-    class_single = defaultdict(set)
-    class_multiple = defaultdict(set)
-
-    class_file = os.path.join(base_tables_outdir, "class_out.txt")
-
-    for r in recs:
-        k,v = r.CLASSE, r.MAT_COD
-        if "/" in k:                   # "2G/H SPA"
-            print(k, "---")
-            cc, mat = k.split()        # ["2G/H". "SPA"]
-            try:
-                cc = cc.split("/")        # ["2G", "H"]
-            except:
-                error(f"Bad class record {cc}")
-                continue
-            cc = [cc[0]] + [cc[0][0] + c for c in cc[1:]]
-            debug(f"Multiclass record {cc}")
+# Ogni tabella è un "aggregatore": ADD riceve i record uno alla volta
+# (tutti gli aggregatori li ricevono durante un'unica lettura del file
+# di export, vedi aggregate) e LINES restituisce le righe del file
+# FILE.  Per avere una nuova tabella basta una nuova classe con il
+# decoratore @table: nessuna lettura in più dei dati, e nessun bisogno
+# di tenere in memoria tutti i record.
+
+TABLES = list()
+
+def table(cls):
+    TABLES.append(cls)
+    return cls
+
+class Aggregator:
+    file = None                         # the name of the output file
+
+# subjects (materie) ----------------------------------------
+
+# Il file mat_out.txt contiene una riga per ciascuna materia con
+# il codice della materia, un segno di uguale come separatore e
+# poi il nome per esteso della materia (come compare nel file di
+# export di EDT). Qualcosa del tipo:
+#
+# DIR = Diritto ed Economia
+# DIS = Disegno e Storia dell'arte
+# FIL = Filosofia
+# ING = Lingua e Cultura Straniera Inglese
+#
+# Questo file può essere usato come base di partenza per creare un
+# altro file da usare come dizionario delle "abbreviazioni".
+# Qualcosa del tipo:
+#
+# DIR = Dir. Eco.
+# DIS = Dis. Arte
+# FIL = Filosofia
+# ING = Inglese
+
+@table
+class Subjects(Aggregator):
+
+    file = "mat_out.txt"
+
+    def __init__(self):
+        self.mat_dic = dict()
+
+    def add(self, r):
+        self.mat_dic[r.MAT_COD] = r.MAT_NOME # the last one wins
+
+    def lines(self):
+        for k,v in sorted(self.mat_dic.items()):
+            yield f"{k} = {v}\n"
+
+# classes --------------------------------------------------
+
+# class "codes" can have different "formats":
+#
+# 1As  = first year, group A, type s (plain old fashion)
+# 1Bsa = first year, group B, type sa (the almost good one)
+#
+# Because there is no Asa not Bs, I'll drop the suffix
+#
+# 2G/H   SPA = second year, TWO separate classes (G/H) doing SPANISH
+# 4G/H/R SPA = second year, THREE separate classes (G/H/R) doing SPANISH
+# this line is equivalent (and will be transformed into) TWO lines
+# (see odv.class_codes)
+
+# Il file class_out contiene una riga per classe con il codice
+# della classe, un segno di uguale come separatore e poi le
+# materie di quella classe (le materie in minuscolo solo estratte
+# dalle righe "multiple").  Qualcosa del tipo:
+#
+# 2F = DIS FIS INF ING IRC ITA MAT MOT SCI STG TED
+# 2G = DIS FIS ING IRC ITA LAT MAT MOT SCI STG spa ted
+# 2H = DIS FIS INF ING IRC ITA MAT MOT SCI STG spa ted
+# 2I = DIS FIS ING IRC ITA LAT MAT MOT SCI STG TED
+
+@table
+class Classes(Aggregator):
+
+    file = "class_out.txt"
+
+    def __init__(self):
+        self.class_single = defaultdict(set)
+        self.class_multiple = defaultdict(set)
+
+    def add(self, r):
+        cc, v = class_codes(r.CLASSE), r.MAT_COD
+        if len(cc) > 1:                # "2G/H SPA"
             for k in cc:
-                debug(f"Multi {k=} {v=}")
-                class_multiple[k].add(v.lower())
-        else:
-            # debug(f"Single {k=} {v=}")
-            class_single[k[:2]].add(v)
-
-    for k,v in class_multiple.items():
-        class_single[k].update(class_multiple[k])
-
-    # Il file class_out contiene una riga per classe con il codice
-    # della classe, un segno di uguale come separatore e poi le
-    # materie di quella classe (le materie in minuscolo solo estratte
-    # dalle righe "multiple").  Qualcosa del tipo:
-    #
-    # 2F = DIS FIS INF ING IRC ITA MAT MOT SCI STG TED
-    # 2G = DIS FIS ING IRC ITA LAT MAT MOT SCI STG spa ted
-    # 2H = DIS FIS INF ING IRC ITA MAT MOT SCI STG spa ted
-    # 2I = DIS FIS ING IRC ITA LAT MAT MOT SCI STG TED
-
-    class_file = os.path.join(base_tables_outdir, "class_out.txt")
-    with open(class_file, "w") as out:
+                self.class_multiple[k].add(v.lower())
+        elif cc:
+            self.class_single[cc[0]].add(v)
+
+    def lines(self):
+        class_single = self.class_single
+        for k,v in self.class_multiple.items():
+            class_single[k].update(v)
         for k,v in sorted(class_single.items()):
             z = " ".join([s for s in sorted(v)])
-            out.write(f"{k} = {z}\n")
+            yield f"{k} = {z}\n"
 
-    # professors --------------------------------------------------
+# professors --------------------------------------------------
 
-    prof_dic = defaultdict(set)
+# Il file prof_out.txt contiene una riga per ciascun professore,
+# con cognome e nome (separati da virgola), il solito separatore e
+# poi la lista delle materie insegnate (codice).
 
-    for r in recs:
-        k,v = (r.DOC_COGN, r.DOC_NOME), r.MAT_COD
-        prof_dic[k].add(v)
+@table
+class Profs(Aggregator):
 
-    # Il file prof_out.txt contiene una riga per ciascun professore,
-    # con cognome e nome (separati da virgola), il solito separatore e
-    # poi la lista delle materie insegnate (codice).
+    file = "prof_out.txt"
 
-    class_file = os.path.join(base_tables_outdir, "prof_out.txt")
-    with open(class_file, "w") as out:
-        for k,v in sorted(prof_dic.items()):
+    def __init__(self):
+        self.prof_dic = defaultdict(set)
+
+    def add(self, r):
+        self.prof_dic[(r.DOC_COGN, r.DOC_NOME)].add(r.MAT_COD)
+
+    def lines(self):
+        for k,v in sorted(self.prof_dic.items()):
             z = " ".join([s for s in sorted(v)])
             k = ", ".join(k)
-            out.write(f"{k} = {z}\n")
-
-    # rooms --------------------------------------------------------
-
-    room_dic = defaultdict(set)
-
-    for r in recs:
-        k,v = r.AULA, r.CLASSE
-        v = v.rstrip("[as]")
-        room_dic[k].add(v)
-
-    # Il file room_out.txt contiene una riga per ciascuna aula, con il
-    # nome dell'aula (che in realtà è una descrizione abbastanza
-    # logorroica che contiene anche la "sigla" dell'aula, tipo 1.23),
-    # il solito separatore e poi la lista delle classi che la
-    # utilizzano (che in orario hanno almeno un'ora in quell'aula).
-    # Qualcosa del tipo:
-    #
-    # <Aule per gruppi>Aula proiezioni (0.22) = 3D/I TED ..............
-    # <Aule per gruppi>Mediateca (0.45) = 1G/H TED 2G/H  ..............
-    # <Lab. Informatica>Lab. Informatica 1 (2° p 2.04) = 1D 1F ........
-    # <Palestre>Palestra 2 (Est) = 1A 1D 1I 1N 1P 1R 2F 2Q 3B  ........
-    # Aula 1Gs (1.33) = 1G
-    #
-    # Anche qui sarebbe bene cercare di trovare dei "nomi" più corti e
-    # più pratici e creare (magari in parte in modo automatico in
-    # parte a mano) un nuovo file con un contenuto del tipo:
-    #
-    # Proiezioni = (0.22)
-    # Lab. Info 1 = (2.04)
-    # Palestra 2 (Est) = ???
-    # Aula 1G = (1.33)
-
-    class_file = os.path.join(base_tables_outdir, "room_out.txt")
-    with open(class_file, "w") as out:
-        for k,v in sorted(room_dic.items()):
+            yield f"{k} = {z}\n"
+
+# rooms --------------------------------------------------------
+
+# Il file room_out.txt contiene una riga per ciascuna aula, con il
+# nome dell'aula (che in realtà è una descrizione abbastanza
+# logorroica che contiene anche la "sigla" dell'aula, tipo 1.23),
+# il solito separatore e poi la lista delle classi che la
+# utilizzano (che in orario hanno almeno un'ora in quell'aula).
+# Qualcosa del tipo:
+#
+# <Aule per gruppi>Aula proiezioni (0.22) = 3D/I TED ..............
+# <Aule per gruppi>Mediateca (0.45) = 1G/H TED 2G/H  ..............
+# <Lab. Informatica>Lab. Informatica 1 (2° p 2.04) = 1D 1F ........
+# <Palestre>Palestra 2 (Est) = 1A 1D 1I 1N 1P 1R 2F 2Q 3B  ........
+# Aula 1Gs (1.33) = 1G
+#
+# Anche qui sarebbe bene cercare di trovare dei "nomi" più corti e
+# più pratici e creare (magari in parte in modo automatico in
+# parte a mano) un nuovo file con un contenuto del tipo:
+#
+# Proiezioni = (0.22)
+# Lab. Info 1 = (2.04)
+# Palestra 2 (Est) = ???
+# Aula 1G = (1.33)
+
+@table
+class Rooms(Aggregator):
+
+    file = "room_out.txt"
+
+    def __init__(self):
+        self.room_dic = defaultdict(set)
+
+    def add(self, r):
+        self.room_dic[r.AULA].add(r.CLASSE.rstrip("[as]"))
+
+    def lines(self):
+        for k,v in sorted(self.room_dic.items()):
             z = " ".join([s for s in sorted(v)])
-            out.write(f"{k} = {z}\n")
+            yield f"{k} = {z}\n"
+
+# Un solo giro sui record per tutti gli aggregatori ...
+
+def aggregate(records, aggregators):
+    adds = [a.add for a in aggregators]
+    for r in records:
+        for add in adds:
+            add(r)
+    return aggregators
+
+# ... e poi i file vengono scritti tutti insieme (in thread separati:
+# il tempo è quasi tutto di formattazione e I/O).
+
+def write_table(agg, base_tables_outdir):
+    f = os.path.join(base_tables_outdir, agg.file)
+    with open(f, "w") as out:
+        out.writelines(agg.lines())
+    debug(f"Written '{f}'")
+    return f
+
+def write_tables(aggregators, base_tables_outdir):
+    os.makedirs(base_tables_outdir, exist_ok=True) # grant dir existence
+    with stage("write"), ThreadPoolExecutor(len(aggregators) or 1) as pool:
+        return list(pool.map(write_table, aggregators,
+                             [base_tables_outdir] * len(aggregators)))
+
+def main(csv_in, base_tables_outdir="./out", tables=None):
+
+    # CSV_IN can also be a loaded Timetable (see odv.iter_records),
+    # TABLES the aggregator classes to use (all of them by default).
+
+    aggregators = [cls() for cls in (tables or TABLES)]
+    with stage("aggregate"):
+        aggregate(iter_records(csv_in), aggregators)
+    return write_tables(aggregators, base_tables_outdir)
 
 def usage():
-    print(f"usage: {progname} export-csv-file")
+    print(f"usage: {progname} [--profile] [--cprofile] export-csv-file")
 
 if __name__ == "__main__":
 
     import sys
     args = sys.argv[1:]
+    setup_logging()
+    pop_profile(args)
     if len(args) > 1:
         usage()
         sys.exit(1)
@@ -0,0 +1,248 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Elaborazione "in blocco" di molti file di export (uno per scuola,
+# uno per ogni versione dell'orario, ...): per ciascuno vengono
+# generati tutti i file di output (tabellone dei prof, orario delle
+# classi, workbook, pagine HTML, tabelle di base, sovrapposizioni)
+# nella sua directory, dentro quella data con --outdir.  Gli export
+# vengono elaborati in parallelo, da processi separati (--jobs, 0 = uno
+# per CPU); alla fine viene stampato un riepilogo con i tempi e gli
+# errori, scritto anche (in JSON) in OUTDIR/batch.json.  Esce con
+# codice 1 se almeno un export non è andato a buon fine.
+#
+#   odv-batch.py data/2020-09/*.csv data/2020-10/*.csv
+#   odv-batch.py --jobs 4 --outdir out/scuole data/scuole
+#
+# Gli argomenti possono essere anche directory: vengono presi tutti i
+# file .csv che contengono.  Se accanto all'export c'è il file delle
+# coppie di docenti (export.csv.pairs.txt, come quelli di
+# odv-synth.py) viene usato quello al posto di odv.PROF_PAIRS.
+
+import os
+import sys
+import json
+import time
+import logging
+import importlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+debug = logging.debug
+
+import odv
+from odv import (
+    setup_logging, load_timetable, Manifest, Record, pop_option, pop_profile,
+    write_clashes,
+    write_prof_dict_xls, write_class_time_table_xls, write_workbook,
+    )
+
+progname = os.path.basename(__file__)
+
+class_timetable = importlib.import_module("odv-class-timetable")
+base_tables = importlib.import_module("odv-base-tables")
+html_pages = importlib.import_module("odv-html")
+
+BATCH_OUTDIR = "out/batch"
+PAIRS_SUFFIX = ".pairs.txt"
+PROF_PAIRS = odv.PROF_PAIRS             # when there is no PAIRS_SUFFIX file
+
+def find_exports(args):
+    # the CSV files in ARGS, directories expanded (sorted)
+    exports = list()
+    for a in args:
+        if os.path.isdir(a):
+            exports.extend(os.path.join(a, f) for f in sorted(os.listdir(a))
+                           if f.lower().endswith(".csv"))
+        else:
+            exports.append(a)
+    return exports
+
+def job_names(exports):
+
+    # Il nome della directory di output di ogni export: il nome del
+    # file senza estensione oppure, se ci sono più file con lo stesso
+    # nome (tipo scuola1/export.csv e scuola2/export.csv), anche il
+    # nome della directory.
+
+    stems = [os.path.splitext(os.path.basename(f))[0] for f in exports]
+    names = list()
+    for f, s in zip(exports, stems):
+        if stems.count(s) > 1:
+            parent = os.path.basename(os.path.dirname(os.path.abspath(f)))
+            s = f"{parent}-{s}"
+        while s in names:
+            s += "_"
+        names.append(s)
+    return names
+
+def prof_pairs_for(csv_in):
+    pairs = csv_in + PAIRS_SUFFIX
+    return pairs if os.path.exists(pairs) else PROF_PAIRS
+
+# Chi tiene il Timetable della volta prima (odv-watch.py, odv-serve.py)
+# confronta il nuovo con quello: se nessun campo è cambiato non rifà
+# niente.  Altrimenti si rifà tutto con publish, e il manifest (vedi
+# odv.Manifest) riscrive solo i file i cui dati sono cambiati: è
+# l'unico meccanismo che decide cosa riscrivere.
+
+def changed_fields(old, new):
+
+    # The fields of the records that differ from the Timetable OLD
+    # (None if unknown) to NEW: all of them if rows were added or
+    # removed, the teachers' names if the pairs (see clean_prof_cod)
+    # changed.
+
+    if old is None or len(old.records) != len(new.records):
+        return set(Record.__fields__)
+    fields = set()
+    for a, b in zip(old.records, new.records):
+        if a != b:
+            fields.update(f for f, x, y in zip(Record.__fields__, a, b)
+                          if x != y)
+    old.teachers, new.teachers          # the pairs are loaded with these
+    if old.pairs != new.pairs:
+        fields.update(("DOC_COGN", "DOC_NOME"))
+    return fields
+
+def publish(csv_in, outdir, manifest=None, jobs=1):
+
+    # Tutti gli output di CSV_IN (anche un Timetable già letto) in
+    # OUTDIR, con il suo manifest (così la volta dopo si rifà solo
+    # quello che è cambiato).
+
+    os.makedirs(outdir, exist_ok=True)
+    tt = load_timetable(csv_in)
+    if manifest is None:
+        manifest = Manifest(os.path.join(outdir, "manifest.json"))
+    write_clashes(tt.clashes, os.path.join(outdir, "clashes.txt"))
+    spans = tt.teachers.spans() if odv.MERGE_CELLS else None
+    write_prof_dict_xls(tt.prof_dict,
+                        os.path.join(outdir, "full-timetable.xls"),
+                        manifest, jobs, spans=spans)
+    write_class_time_table_xls(
+        tt, os.path.join(outdir, "class-timetable.xls"), manifest, jobs)
+    write_workbook(tt, os.path.join(outdir, "timetable.xlsx"), manifest, jobs)
+    with odv.stage("aggregate"):
+        class_dict = class_timetable.occupancy_to_class_dict(tt.classes)
+    class_timetable.write_html(
+        class_dict, os.path.join(outdir, "class-timetable-html"),
+        manifest, jobs,
+        class_timetable.old_pages(tt.store.codes("CLASSE")[1]))
+    class_timetable.write_csv(
+        class_dict, os.path.join(outdir, "class-timetable-csv"), manifest)
+    sections = html_pages.timetable_grids(tt)
+    html_pages.write_pages(sections, os.path.join(outdir, "html"), manifest)
+    html_pages.write_site(sections, os.path.join(outdir, "html"), manifest)
+    base_tables.main(tt, outdir)
+    manifest.save()
+    return tt
+
+def run_job(job):
+
+    # Eseguita in un processo del pool: gli errori non devono fermare
+    # gli altri export, quindi vengono restituiti nel risultato.  Le
+    # fasi vengono sempre misurate (vedi odv.stage) e finiscono nel
+    # riepilogo.
+
+    name, csv_in, outdir = job
+    odv.PROFILE = True
+    odv.STAGES.clear()
+    odv.COUNTERS.clear()
+    odv.PROF_PAIRS = prof_pairs_for(csv_in)
+    result = {"name": name, "export": csv_in, "outdir": outdir}
+    start = time.perf_counter()
+    try:
+        tt = publish(csv_in, outdir)
+        result.update(ok=True, rows=len(tt.records), clashes=len(tt.clashes))
+    except Exception as e:
+        result.update(ok=False, error=f"{type(e).__name__}: {e}",
+                      traceback=traceback.format_exc())
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    result["stages"] = {k: round(t, 4) for k, (c, t) in odv.STAGES.items()}
+    result["counters"] = dict(odv.COUNTERS)
+    return result
+
+def format_result(r):
+    if r["ok"]:
+        return (f"ok   {r['seconds']:8.2f}s {r['rows']:7d} rows "
+                f"{r['clashes']:5d} clashes  {r['name']}")
+    return f"FAIL {r['seconds']:8.2f}s  {r['name']}: {r['error']}"
+
+def main(exports, batch_outdir=BATCH_OUTDIR, jobs=0):
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    todo = [(name, csv_in, os.path.join(batch_outdir, name))
+            for name, csv_in in zip(job_names(exports), exports)]
+
+    start = time.perf_counter()
+    results = dict()
+    with ProcessPoolExecutor(max_workers=max(1, min(jobs, len(todo)))) as pool:
+        futures = [pool.submit(run_job, job) for job in todo]
+        for f in as_completed(futures):
+            r = f.result()
+            results[r["name"]] = r
+            print(format_result(r), flush=True)
+    elapsed = time.perf_counter() - start
+
+    # Riepilogo nell'ordine degli export, con il tempo totale e la
+    # somma dei tempi dei singoli export (la differenza è il
+    # guadagno dei processi in parallelo).
+
+    results = [results[name] for name, _, _ in todo]
+    failed = [r for r in results if not r["ok"]]
+    busy = sum(r["seconds"] for r in results)
+    print(f"\n{len(results)} exports, {len(failed)} failed, "
+          f"{elapsed:.2f}s elapsed ({busy:.2f}s of work, {jobs} jobs)")
+    stages = dict()
+    for r in results:
+        for k, t in r["stages"].items():
+            stages[k] = stages.get(k, 0.0) + t
+    for k, t in stages.items():
+        print(f"  {k:10s} {t:9.2f}s")
+
+    # Con --profile il report (vedi odv.pop_profile) ha le fasi e i
+    # contatori di tutti gli export, sommati: il lavoro è fatto nei
+    # processi del pool, non in questo.
+
+    if odv.PROFILE:
+        for r in results:
+            for k, t in r["stages"].items():
+                s = odv.STAGES.setdefault(k, [0, 0.0])
+                s[0] += 1
+                s[1] += t
+            for k, n in r["counters"].items():
+                odv.count(k, n)
+    for r in failed:
+        print(f"\n{r['name']} ({r['export']}):\n{r['traceback']}",
+              file=sys.stderr)
+
+    os.makedirs(batch_outdir, exist_ok=True)
+    with open(os.path.join(batch_outdir, "batch.json"), "w") as out:
+        json.dump({"elapsed": round(elapsed, 4), "jobs": jobs,
+                   "results": results}, out, indent=1)
+    return results
+
+def usage():
+    print(f"usage: {progname} [--jobs N] [--outdir DIR] [--profile] "
+          f"[--cprofile] export-csv-file-or-dir [...]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    jobs = int(pop_option(args, "--jobs", 0))
+    batch_outdir = pop_option(args, "--outdir", BATCH_OUTDIR)
+    odv.PROFILE_FILE = os.path.join(batch_outdir, "profile.json")
+    pop_profile(args)
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    exports = find_exports(args)
+    if not exports:
+        usage()
+        sys.exit(1)
+    results = main(exports, batch_outdir, jobs)
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
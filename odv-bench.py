@@ -0,0 +1,139 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Misura dei tempi delle varie fasi (lettura, viste, scrittura dei
+# file) su export sintetici (vedi odv-synth.py) di dimensione
+# crescente: una scuola, un distretto, una provincia.  Da lanciare
+# prima e dopo ogni modifica "importante", salvando i numeri con
+# --json per poterli confrontare.  I file generati vanno in una
+# directory temporanea (o in quella data con --workdir).
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import importlib
+
+import odv
+from odv import (
+    setup_logging, pop_option, Timetable, csv_to_records,
+    data_to_prof_dict, write_prof_dict_xls, write_class_time_table_xls,
+    write_workbook,
+    )
+
+progname = os.path.basename(__file__)
+
+synth = importlib.import_module("odv-synth")
+class_timetable = importlib.import_module("odv-class-timetable")
+html_pages = importlib.import_module("odv-html")
+
+def timed(func, repeat=1):
+    # best time of REPEAT runs, and the result of the last one
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def loaded(records):
+    # a Timetable with all the views already computed
+    tt = Timetable(records)
+    tt.prof_dict, tt.classes, tt.teachers, tt.rooms, tt.subject_dict
+    return tt
+
+def write_html_site(tt, html_outdir):
+    # as odv-html.py, but without the manifest (that would skip repeats)
+    sections = html_pages.timetable_grids(tt)
+    html_pages.write_pages(sections, html_outdir)
+    html_pages.write_site(sections, html_outdir)
+
+def bench(scale, schools, workdir, repeat=1):
+
+    csv_in = os.path.join(workdir, f"{scale}.csv")
+    pairs = csv_in + ".pairs.txt"
+    out = os.path.join(workdir, scale)
+    os.makedirs(out, exist_ok=True)
+    synth.main(csv_in, pairs, schools)
+    odv.PROF_PAIRS = pairs
+
+    odv.USE_CACHE = False
+    t, records = timed(lambda: tuple(csv_to_records(csv_in)), repeat)
+    stages = [("csv_to_records", t)]
+    odv.USE_CACHE = True
+    tuple(csv_to_records(csv_in))       # fill the cache
+    t, _ = timed(lambda: tuple(csv_to_records(csv_in)), repeat)
+    stages.append(("csv_to_records (cached)", t))
+
+    t, _ = timed(lambda: class_timetable.occupancy_to_class_dict(
+        Timetable(records).classes), repeat)
+    stages.append(("occupancy_to_class_dict", t))
+    t, _ = timed(lambda: data_to_prof_dict(Timetable(records)), repeat)
+    stages.append(("data_to_prof_dict", t))
+    t, _ = timed(lambda: Timetable(records).clashes, repeat)
+    stages.append(("find_clashes", t))
+
+    tt = loaded(records)
+    writers = [
+        ("write_prof_dict_xls", lambda: write_prof_dict_xls(
+            tt.prof_dict, os.path.join(out, "full-timetable.xlsx"))),
+        ("write_class_time_table_xls", lambda: write_class_time_table_xls(
+            tt, os.path.join(out, "class-timetable.xlsx"))),
+        ("write_workbook", lambda: write_workbook(
+            tt, os.path.join(out, "timetable.xlsx"))),
+        ("write_html (classes)", lambda: class_timetable.write_html(
+            class_timetable.occupancy_to_class_dict(tt.classes),
+            os.path.join(out, "class-timetable-html"))),
+        ("html pages and site", lambda: write_html_site(
+            tt, os.path.join(out, "html"))),
+    ]
+    for name, func in writers:
+        t, _ = timed(func, repeat)
+        stages.append((name, t))
+
+    return [{"scale": scale, "rows": len(records), "stage": name,
+             "seconds": round(t, 4)} for name, t in stages]
+
+def main(scales=tuple(synth.SCALES), workdir=None, repeat=1, json_out=None):
+
+    logging.getLogger().setLevel(logging.WARNING)
+    workdir = workdir or tempfile.mkdtemp(prefix="odv-bench-")
+    odv.CACHE_DIR = os.path.join(workdir, "cache")
+    odv.MANIFEST_FILE = os.path.join(workdir, "manifest.json")
+
+    results = list()
+    for scale in scales:
+        rr = bench(scale, synth.SCALES[scale], workdir, repeat)
+        for r in rr:
+            print(f"{r['scale']:10s} {r['rows']:7d} "
+                  f"{r['stage']:28s} {r['seconds']:9.4f}")
+        results.extend(rr)
+
+    if json_out:
+        with open(json_out, "w") as out:
+            json.dump(results, out, indent=1)
+    return results
+
+def usage():
+    print(f"usage: {progname} [--scales school,district,province] "
+          f"[--repeat N] [--workdir DIR] [--json FILE]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    scales = pop_option(args, "--scales", ",".join(synth.SCALES)).split(",")
+    repeat = int(pop_option(args, "--repeat", 1))
+    workdir = pop_option(args, "--workdir")
+    json_out = pop_option(args, "--json")
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    if args or any(s not in synth.SCALES for s in scales):
+        usage()
+        sys.exit(1)
+    main(scales, workdir, repeat, json_out)
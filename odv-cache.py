@@ -0,0 +1,51 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Gestione della cache dei file di export già letti (vedi la sezione
+# "Cache of parsed exports" in odv.py): elenca, svuota o sfoltisce la
+# directory della cache.
+
+import os
+import sys
+
+import odv
+from odv import setup_logging, cache_entries, cache_clear, cache_evict
+
+progname = os.path.basename(__file__)
+
+def main(command="--list"):
+
+    if command == "--list":
+        ee = cache_entries()
+        for path, size, _ in ee:
+            print(f"{size:10d} {path}")
+        total = sum(e[1] for e in ee)
+        print(f"{len(ee)} entries, {total} bytes "
+              f"(max {odv.CACHE_MAX_BYTES})")
+    elif command == "--clear":
+        for path in cache_clear():
+            print(f"removed {path}")
+    elif command == "--evict":
+        for path in cache_evict():
+            print(f"evicted {path}")
+    else:
+        raise ValueError(f"Bad command '{command}'")
+
+def usage():
+    print(f"usage: {progname} [--list | --clear | --evict]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    if len(args) > 1:
+        usage()
+        sys.exit(1)
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    if args and args[0] not in "--list --clear --evict".split():
+        usage()
+        sys.exit(1)
+    main(*args)
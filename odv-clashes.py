@@ -0,0 +1,41 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Controllo delle sovrapposizioni: stampa tutti i docenti, le classi e
+# le aule che hanno due (o più) lezioni nella stessa ora, con i
+# NUMERO delle righe del file di export coinvolte.  Esce con codice 1
+# se ne trova almeno una, così può essere usato in uno script dopo
+# ogni export da EDT.
+
+import os
+import sys
+
+from odv import (
+    setup_logging, load_timetable, format_clash, pop_profile, CSV_INPUT,
+    )
+
+progname = os.path.basename(__file__)
+
+def main(csv_in):
+    clashes = load_timetable(csv_in).clashes
+    for c in clashes:
+        print(format_clash(c))
+    return clashes
+
+def usage():
+    print(f"usage: {progname} [--profile] [--cprofile] [export-csv-file]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    pop_profile(args)
+    if len(args) > 1:
+        usage()
+        sys.exit(1)
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    csv_in = args and args[0] or CSV_INPUT
+    sys.exit(1 if main(csv_in) else 0)
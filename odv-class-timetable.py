@@ -8,16 +8,13 @@
 # indica la materia e il docente.
 
 import os
-import csv
-from collections import defaultdict
 import logging
-logging.basicConfig(level=logging.DEBUG,
-                    format="%(levelname)s: %(message)s")
 debug = logging.debug
 
 from odv import (
-    Record, get_encoding, csv_to_records,
-    DAYS_INDEX, START_SHIFT, START_TIMES,
+    setup_logging, load_timetable, Manifest, inputs_hash, parallel_map,
+    pop_option, pop_profile, stage, html_rows, html_table, html_text,
+    safe_file_name, class_codes, FREE, DAYS_PER_WEEK, LESSONS_PER_DAY, np,
     )
 
 progname = os.path.basename(__file__)
@@ -27,46 +24,28 @@ HTML_OUTDIR = "out/class-timetable-html/"
 XML_OUTDIR = "out/class-timetable-xls/"
 CSV_OUTDIR = "out/class-timetable-csv/"
 
-# Qui prendo i record generati in csv_to_records e creo un dizionario
-# con il nome della classe come chiave e i dati (di solito materia e
-# docente) per le celle della tabella dell'orario per classe.
-
-def records_to_class_dict(records):
-
-    class_dict = defaultdict(list)
-    for r in records:
-        class_id = r.CLASSE
-        size = int(r.DURATA[0])
-        for i in range(size):
-            o = START_SHIFT[r.ORA_INIZIO] + i
-            class_data = (DAYS_INDEX[r.GIORNO],
-                          o,
-                          r.MAT_COD,
-                          r.DOC_COGN)
-            class_dict[class_id].append(class_data)
+# Qui prendo la matrice delle classi (vedi odv.Occupancy) e creo un
+# dizionario con il nome della classe come chiave e i dati (di solito
+# materia e docente) per le celle della tabella dell'orario per
+# classe.  Le righe "multiclasse" (tipo "2G/H SPA") finiscono
+# nell'orario di ciascuna delle classi coinvolte.
+
+def occupancy_to_class_dict(classes):
+
+    class_dict = dict()
+    for klass, row in zip(classes.names, classes.grid):
+        lessons = list()
+        for slot in np.flatnonzero(row != FREE):
+            d, h = divmod(int(slot), LESSONS_PER_DAY)
+            for r in classes.group(row[slot]):
+                lessons.append((d, h, r.MAT_COD, r.DOC_COGN))
+        class_dict[klass] = lessons
     debug(f"{len(class_dict)} classes found")
     return class_dict
 
-# Questa stringa contiene il "formato" della tabella con l'orario
-# della classe.  Al momento una cosa molto grezza a cui sarebbe meglio
-# aggiungere un po' di classi per poi abbellirla con i CSS.
-
-HTML_FMT = r"""
-
-<table border="1">
-  <tr>
-    <td align="center" colspan="7" bold="1">%(klass)s</td>
-  </tr>
-  <tr>
-    <th></th>
-    <th>Lun</th><th>Mar</th><th>Mer</th>
-    <th>Gio</th><th>Ven</th><th>Sab</th>
-  </tr>
-
-  %(rows)s
-</table>
-
-"""
+# Il "formato" della tabella con l'orario della classe (HTML_TABLE) e
+# il codice che la genera sono in odv (vedi html_table), dove servono
+# anche per le pagine dei prof e delle aule.
 
 # Qui prendo le ore di lezione di una classe e restituisco una
 # "griglia" (una lista di liste) che poi "formatterò" in HTML (o
@@ -74,87 +53,160 @@ HTML_FMT = r"""
 
 def lessons_to_grid(lessons):
     grid = list()
-    for i in range(8):
-        grid.append([""] * 6)
+    for i in range(LESSONS_PER_DAY):
+        grid.append([""] * DAYS_PER_WEEK)
     for d, h, m, p in lessons:
+        if grid[h][d]:                  # multiclass: "SPA/TED"
+            m0, p0 = grid[h][d]
+            m, p = f"{m0}/{m}", f"{p0}/{p}"
         grid[h][d] = (m,p)
     return grid
 
-# Qui prendo la griglia di cui sopra e la formatto in HTML.
-
-def grid_to_table(grid):
-    t = ""
-    for ri, row in enumerate(grid):              # hours
-        t += "  <tr>\n    "
-        t += "<td>%s</td>" % START_TIMES[ri]
-        for cell in row:
-            if cell:
-                m, p = cell
-            else:
-                m, p = "",""
-            t += '  <td align="center">%s</br>%s</td>' % (m, p)
-        t += "\n  </tr>\n"
-    # print(t)
-    return t
-
 # Qui ... si capisce.
 
 def lessons_to_table(lessons):
     g = lessons_to_grid(lessons)
-    return grid_to_table(g)
+    return html_rows(g)
 
 # E qui anche.
 
 def class_to_html_table(klass, lessons):
-    return HTML_FMT % {"klass": klass,
-                       "rows": lessons_to_table(lessons)}
+    return html_table(klass, lessons_to_grid(lessons))
 
 def class_to_csv_table(klass, lessons):
     return f"{klass} -> {lessons}\n"
 
-def write_csv(class_dict, csv_outdir):
+def write_csv(class_dict, csv_outdir, manifest=None):
 
     os.makedirs(csv_outdir, exist_ok=True) # grant dir existence
     csv_out = os.path.join(csv_outdir, "class-timetable.csv")
+    if manifest is not None:
+        key = inputs_hash(class_dict)
+        if not manifest.stale(csv_out, key):
+            return
+        manifest.update(csv_out, key)
     debug(f"Writing output CSV file '{csv_out}'")
-    with open(csv_out, "w") as output:
+    with stage("write"), open(csv_out, "w") as output:
         for k, v in class_dict.items():
             t = class_to_csv_table(k, v)
             output.write(t)
 
-def write_html(class_dict, html_outdir):
+def class_to_html_item(item):
+    return class_to_html_table(*item)
+
+# Una volta c'era una pagina per ogni valore di CLASSE dell'export
+# ("1Asa.html", "1As.html", "[1G-H_TED].html", ...), adesso ce n'è una
+# per classe ("1A.html").  Perché i vecchi indirizzi (magari già
+# pubblicati) funzionino ancora, al posto delle vecchie pagine metto
+# un rimando alla pagina della classe (o, per le righe multiclasse, i
+# link alle pagine delle classi).
+
+REDIRECT_PAGE = r"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+%(refresh)s<title>%(title)s</title>
+</head>
+<body>
+%(links)s
+</body>
+</html>
+"""
 
-    os.makedirs(html_outdir, exist_ok=True) # grant dir existence
-    for k, v in class_dict.items():
-        t = class_to_html_table(k, v)
+def old_page_name(classe):
+    return classe.replace("/", "-").replace(" ", "_")
+
+def old_pages(symbols):
+
+    # SYMBOLS are the values of CLASSE in the export (see
+    # RecordStore.codes), returns {CLASSE: classes}
+
+    return {s: class_codes(s) for s in symbols if s.strip()}
 
-        # A volte il "codice della classe" è qualcosa del tipo "2G/H
-        # SPA", che come stringa da utilizzare nel nome di un file non
-        # è proprio il massimo!
+def redirect_page(title, classes):
+    pages = [f"{safe_file_name(k)}.html" for k in classes]
+    refresh = ""
+    if len(pages) == 1:
+        refresh = f'<meta http-equiv="refresh" content="0; url={pages[0]}">\n'
+    links = " ".join(f'<a href="{p}">{html_text(k)}</a>'
+                     for k, p in zip(classes, pages))
+    return REDIRECT_PAGE % {"refresh": refresh, "title": html_text(title),
+                            "links": links}
 
-        k = k.replace("/", "-")
-        k = k.replace(" ", "_")
+def write_html(class_dict, html_outdir, manifest=None, jobs=1, redirects=None):
 
-        f = os.path.join(html_outdir, "%s.html" % k)
-        with open(f, "w") as html_out:
-            html_out.write(t + "\n")
+    # Prima scelgo le classi da (ri)fare, poi le pagine vengono
+    # generate (anche in parallelo, vedi odv.parallel_map) e infine
+    # scritte nei file, nell'ordine delle classi.  REDIRECTS sono le
+    # vecchie pagine (vedi old_pages).
+
+    os.makedirs(html_outdir, exist_ok=True) # grant dir existence
+    todo = list()
+    files = list()
+    for k, v in class_dict.items():
+        f = os.path.join(html_outdir, "%s.html" % safe_file_name(k))
+        files.append(f)
+
+        # Se le lezioni della classe non sono cambiate dall'ultima
+        # volta (vedi odv.Manifest) non serve rifare la pagina.
+
+        if manifest is not None:
+            key = inputs_hash(k, v)
+            if not manifest.stale(f, key):
+                continue
+            manifest.update(f, key)
+        todo.append((f, (k, v)))
+
+    with stage("render"):
+        pages = parallel_map(class_to_html_item, [o for f, o in todo], jobs)
+    with stage("write"):
+        for (f, _), t in zip(todo, pages):
+            with open(f, "w") as html_out:
+                html_out.write(t + "\n")
+        for classe, classes in (redirects or dict()).items():
+            f = os.path.join(html_outdir, f"{old_page_name(classe)}.html")
+            if f in files:              # "1A" era già "1A.html"
+                continue
+            files.append(f)
+            if manifest is not None:
+                key = inputs_hash(classe, classes)
+                if not manifest.stale(f, key):
+                    continue
+                manifest.update(f, key)
+            with open(f, "w") as html_out:
+                html_out.write(redirect_page(classe, classes))
+
+    # E le pagine delle classi (o i rimandi) che non ci sono più le
+    # tolgo: solo quelle che il manifest sa di aver scritto lui.
+
+    if manifest is not None:
+        manifest.prune(html_outdir, files)
 
 # Entry point principale del programma
 
-def main(csv_in, html_outdir=HTML_OUTDIR):
+def main(csv_in, html_outdir=HTML_OUTDIR, jobs=1):
 
-    recs = csv_to_records(csv_in)
-    class_dict = records_to_class_dict(recs)
-    write_html(class_dict, html_outdir)
-    write_csv(class_dict, CSV_OUTDIR)
+    tt = load_timetable(csv_in)
+    classes = tt.classes
+    with stage("aggregate"):
+        class_dict = occupancy_to_class_dict(classes)
+    manifest = Manifest()
+    write_html(class_dict, html_outdir, manifest, jobs,
+               old_pages(tt.store.codes("CLASSE")[1]))
+    write_csv(class_dict, CSV_OUTDIR, manifest)
+    manifest.save()
 
 def usage():
-    print(f"usage: {progname} [export-csv-file]")
+    print(f"usage: {progname} [--jobs N] [--profile] [--cprofile] "
+          f"[export-csv-file]")
 
 if __name__ == "__main__":
 
     import sys
     args = sys.argv[1:]
+    setup_logging()
+    jobs = int(pop_option(args, "--jobs", 1))
+    pop_profile(args)
     if len(args) > 1:
         usage()
         sys.exit(1)
@@ -162,4 +214,4 @@ if __name__ == "__main__":
         usage()
         sys.exit(0)
     csv_in = args and args[0] or CSV_INPUT
-    main(csv_in)
+    main(csv_in, jobs=jobs)
@@ -0,0 +1,225 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Cosa è cambiato tra due export?  Quando l'export viene rifatto da EDT
+# stampa le lezioni aggiunte (+), tolte (-) e spostate (>) per ogni
+# docente, classe e aula.  Con più di due export (o una directory, come
+# per odv-batch.py) confronta ciascuno con il precedente: ogni export
+# viene letto una volta sola.  Va bene anche il database SQLite (vedi
+# odv-sqlite.py):
+#
+#   odv-diff.py vecchio.csv nuovo.csv
+#   odv-diff.py data/2020-*/export.csv
+#   odv-diff.py out/timetable.sqlite#3 out/timetable.sqlite#4
+#
+# Ogni ora di lezione diventa una chiave (docente, classe, materia,
+# slot) con i nomi già normalizzati (coppie di docenti risolte, righe
+# multiclasse divise, vedi Timetable.teachers e class_codes), e l'aula
+# come valore: le aggiunte e le tolte sono differenze tra gli insiemi
+# di chiavi (hash, niente confronti a coppie), le ore della stessa
+# (docente, classe, materia) tolte da uno slot e aggiunte in un altro
+# sono spostamenti, e così anche le chiavi presenti in tutti e due con
+# un'aula diversa.  Esce con codice 1 se c'è almeno un cambiamento
+# (come diff), così può essere usato in uno script dopo ogni export.
+
+import os
+import sys
+import json
+import logging
+import importlib
+from collections import defaultdict, namedtuple
+
+import odv
+from odv import (
+    setup_logging, load_timetable, pop_option, pop_profile, stage,
+    entity_name, slot_name, LESSONS_PER_DAY,
+    )
+
+progname = os.path.basename(__file__)
+
+batch = importlib.import_module("odv-batch")
+
+KINDS = ("docenti", "classi", "aule")
+
+# OLD and NEW are the first slot (None for added and removed lessons),
+# HOURS how many consecutive slots (see merge_hours).
+
+Change = namedtuple("Change", "what teacher klass subject old new "
+                    "old_room new_room hours")
+
+def lesson_keys(tt):
+
+    # {(teacher, class, subject, slot): room} with one item for each
+    # hour of each lesson of TT (a record with no class gets "").
+
+    occ = tt.teachers
+    classes = tt.class_keys
+    records = tt.records
+    names = occ.names
+    lessons = dict()
+    entity, slot, rec = occ.triples()
+    with stage("aggregate"):
+        for e, s, r in zip(entity.tolist(), slot.tolist(), rec.tolist()):
+            o = records[r]
+            for k in classes[r] or ("",):
+                lessons[(names[e], k, o.MAT_COD, s)] = o.AULA
+    return lessons
+
+def load_lessons(src):
+    odv.PROF_PAIRS = batch.prof_pairs_for(src)
+    return lesson_keys(load_timetable(src))
+
+def diff_lessons(old, new):
+
+    # The changes from OLD to NEW (see lesson_keys), one per hour.
+
+    with stage("check"):
+        removed = defaultdict(list)     # (teacher, class, subject) -> slots
+        added = defaultdict(list)
+        for k in old.keys() - new.keys():
+            removed[k[:3]].append(k[3])
+        for k in new.keys() - old.keys():
+            added[k[:3]].append(k[3])
+        changes = list()
+        for lesson in removed.keys() | added.keys():
+            gone = sorted(removed.get(lesson, ()))
+            came = sorted(added.get(lesson, ()))
+            for a, b in zip(gone, came):
+                changes.append(Change("moved", *lesson, a, b,
+                                      old[(*lesson, a)], new[(*lesson, b)],
+                                      1))
+            for a in gone[len(came):]:
+                changes.append(Change("removed", *lesson, a, None,
+                                      old[(*lesson, a)], None, 1))
+            for b in came[len(gone):]:
+                changes.append(Change("added", *lesson, None, b,
+                                      None, new[(*lesson, b)], 1))
+        for k in old.keys() & new.keys():
+            if old[k] != new[k]:
+                changes.append(Change("moved", *k[:3], k[3], k[3],
+                                      old[k], new[k], 1))
+        return merge_hours(changes)
+
+def slot_key(s):
+    return -1 if s is None else s
+
+def merge_hours(changes):
+
+    # The hours of a two (or more) hours lesson that changed in the
+    # same way become a single change.
+
+    def same(c):
+        return c.what, c.teacher, c.klass, c.subject, c.old_room, c.new_room
+
+    changes.sort(key=lambda c: (c.what, c.teacher, c.klass, c.subject,
+                                slot_key(c.old), slot_key(c.new)))
+    merged = list()
+    for c in changes:
+        p = merged[-1] if merged else None
+        if (p is not None and same(p) == same(c) and
+            all(a is None or (a + p.hours == b and
+                              a // LESSONS_PER_DAY == b // LESSONS_PER_DAY)
+                for a, b in ((p.old, c.old), (p.new, c.new)))):
+            merged[-1] = p._replace(hours=p.hours + 1)
+        else:
+            merged.append(c)
+    return merged
+
+def by_kind(changes):
+
+    # {kind: {name: [changes]}}: a move to another room is listed under
+    # both rooms.
+
+    kinds = {k: defaultdict(list) for k in KINDS}
+    for c in changes:
+        kinds["docenti"][entity_name(c.teacher)].append(c)
+        if c.klass:
+            kinds["classi"][c.klass].append(c)
+        for room in {c.old_room, c.new_room} - {None, ""}:
+            kinds["aule"][room].append(c)
+    return kinds
+
+def format_slot(slot, hours):
+    return slot_name(slot) + (f" ({hours}h)" if hours > 1 else "")
+
+def format_change(c):
+    lesson = f"{entity_name(c.teacher)} / {c.klass or '-'} / {c.subject}"
+    if c.what == "added":
+        return f"+ {format_slot(c.new, c.hours):22s} {lesson} " \
+            f"[{c.new_room or '-'}]"
+    if c.what == "removed":
+        return f"- {format_slot(c.old, c.hours):22s} {lesson} " \
+            f"[{c.old_room or '-'}]"
+    where = format_slot(c.old, c.hours)
+    if c.new != c.old:
+        where += f" -> {slot_name(c.new)}"
+    room = c.new_room or "-"
+    if c.new_room != c.old_room:
+        room = f"{c.old_room or '-'} -> {room}"
+    return f"> {where:22s} {lesson} [{room}]"
+
+def change_dict(c):
+    return {"what": c.what, "teacher": entity_name(c.teacher),
+            "class": c.klass, "subject": c.subject,
+            "old": None if c.old is None else slot_name(c.old),
+            "new": None if c.new is None else slot_name(c.new),
+            "old_room": c.old_room, "new_room": c.new_room, "hours": c.hours}
+
+def change_lines(old_src, new_src, changes, kinds=KINDS):
+    yield f"--- {old_src}\n+++ {new_src}\n"
+    counts = {w: sum(c.hours for c in changes if c.what == w)
+              for w in ("added", "removed", "moved")}
+    yield ", ".join(f"{n} hours {w}" for w, n in counts.items()) + "\n"
+    for kind, names in by_kind(changes).items():
+        if kind not in kinds or not names:
+            continue
+        yield f"\n== {kind} ({len(names)})\n"
+        for name, cc in sorted(names.items()):
+            yield f"\n{name}\n"
+            for c in cc:
+                yield f"  {format_change(c)}\n"
+
+def main(exports, kinds=KINDS, as_json=False):
+
+    logging.getLogger().setLevel(logging.WARNING)
+    diffs = list()
+    old_src, old = exports[0], load_lessons(exports[0])
+    for new_src in exports[1:]:
+        new = load_lessons(new_src)
+        changes = diff_lessons(old, new)
+        diffs.append((old_src, new_src, changes))
+        if not as_json:
+            sys.stdout.writelines(change_lines(old_src, new_src, changes,
+                                               kinds))
+        old_src, old = new_src, new
+    if as_json:
+        json.dump([{"old": a, "new": b,
+                    "changes": [change_dict(c) for c in changes]}
+                   for a, b, changes in diffs],
+                  sys.stdout, ensure_ascii=False, indent=1)
+        print()
+    return diffs
+
+def usage():
+    print(f"usage: {progname} [--kind docenti|classi|aule] [--json] "
+          f"[--profile] [--cprofile] old-export new-export [...]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    pop_profile(args)
+    kind = pop_option(args, "--kind")
+    as_json = "--json" in args
+    if as_json:
+        args.remove("--json")
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    exports = batch.find_exports(args)
+    if len(exports) < 2 or kind not in (None, *KINDS):
+        usage()
+        sys.exit(2)
+    diffs = main(exports, (kind,) if kind else KINDS, as_json)
+    sys.exit(1 if any(changes for _, _, changes in diffs) else 0)
@@ -0,0 +1,132 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Chi è libero?  Per le supplenze: elenca i docenti (o le classi, o le
+# aule) liberi in una certa ora di un certo giorno, eventualmente per
+# più ore di fila (--hours), oppure le ore in cui sono liberi insieme
+# tutti quelli indicati con --with.  Le risposte vengono dalle
+# "bitmask" di odv.Availability.
+#
+#   odv-free.py mar 3                       docenti liberi martedì 3a ora
+#   odv-free.py --rooms --match Lab ven 09h30 --hours 2
+#   odv-free.py --with Manini Carli         ore libere in comune
+
+import os
+import sys
+import logging
+
+from odv import (
+    setup_logging, load_timetable, pop_option, pop_profile, entity_name,
+    slot_name, safe_file_name,
+    CSV_INPUT, DAYS_SHIFT, START_TIMES, LESSONS_PER_DAY,
+    )
+
+progname = os.path.basename(__file__)
+
+KINDS = {"--teachers": "teachers", "--classes": "classes", "--rooms": "rooms"}
+
+def parse_day(text):
+    # "martedì", "martedi", "mar" o "2" -> 1
+    t = text.lower().replace("i'", "ì")
+    if t.isdigit() and 1 <= int(t) <= len(DAYS_SHIFT):
+        return int(t) - 1
+    for i, day in enumerate(DAYS_SHIFT):
+        plain = day.replace("ì", "i")
+        if len(t) >= 3 and (day.startswith(t) or plain.startswith(t)):
+            return i
+    raise ValueError(f"Bad day '{text}'")
+
+def parse_hour(text):
+    # "3" (terza ora), "09h30", "9:30" o "9.30" -> 2
+    if text.isdigit() and 1 <= int(text) <= LESSONS_PER_DAY:
+        return int(text) - 1
+    t = text.replace(":", "h").replace(".", "h").zfill(5)
+    if t in START_TIMES:
+        return START_TIMES.index(t)
+    raise ValueError(f"Bad hour '{text}'")
+
+def parse_hours(text):
+    # "2" -> 2, at least one hour and no more than a day
+    if text.isdigit() and 1 <= int(text) <= LESSONS_PER_DAY:
+        return int(text)
+    raise ValueError(f"Bad hours '{text}'")
+
+def find_name(avail, text):
+    # the entity whose name (or surname, or name in the URLs, see
+    # safe_file_name) is TEXT or, if only one, whose name contains TEXT
+    names = [n for n in avail.names if entity_name(n) == text]
+    if not names:
+        names = [n for n in avail.names
+                 if isinstance(n, tuple) and n[0] == text]
+    if not names:
+        names = [n for n in avail.names if safe_file_name(n) == text]
+    if not names:
+        t = text.lower()
+        names = [n for n in avail.names if t in entity_name(n).lower() or
+                 t in safe_file_name(n).lower()]
+    if len(names) != 1:
+        found = ", ".join(entity_name(n) for n in names[:5]) or "nothing"
+        raise ValueError(f"'{text}' matches {found}")
+    return names[0]
+
+def free_at(tt, kind, day, hour, hours=1, match=None):
+    avail = tt.availability(kind)
+    names = avail.free_for(day * LESSONS_PER_DAY + hour, hours)
+    names = [entity_name(n) for n in names]
+    if match:
+        names = [n for n in names if match.lower() in n.lower()]
+    return names
+
+def free_with(tt, kind, names, hours=1):
+    avail = tt.availability(kind)
+    names = [find_name(avail, n) for n in names]
+    return avail.common_free(names, hours)
+
+def main(args, kind="teachers", hours=1, match=None, together=False,
+         csv_in=CSV_INPUT):
+
+    logging.getLogger().setLevel(logging.WARNING)
+    tt = load_timetable(csv_in)
+    if together:
+        for first, length in free_with(tt, kind, args, hours):
+            print(f"{slot_name(first)} {length}h")
+    else:
+        day, hour = parse_day(args[0]), parse_hour(args[1])
+        for name in free_at(tt, kind, day, hour, hours, match):
+            print(name)
+
+def usage():
+    print(f"usage: {progname} [--teachers | --classes | --rooms] "
+          f"[--match TEXT] [--hours N] [--export FILE] [--profile] "
+          f"DAY HOUR\n"
+          f"       {progname} [--teachers | --classes | --rooms] "
+          f"[--hours N] [--export FILE] [--profile] --with NAME [NAME ...]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    pop_profile(args)
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    hours = pop_option(args, "--hours", "1")
+    match = pop_option(args, "--match")
+    csv_in = pop_option(args, "--export", CSV_INPUT)
+    kind = "teachers"
+    for k in KINDS:
+        if k in args:
+            args.remove(k)
+            kind = KINDS[k]
+    together = "--with" in args
+    if together:
+        args.remove("--with")
+    if (together and not args) or (not together and len(args) != 2):
+        usage()
+        sys.exit(1)
+    try:
+        main(args, kind, parse_hours(hours), match, together, csv_in)
+    except ValueError as e:
+        print(f"{progname}: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -3,29 +3,43 @@
 import sys
 import os
 # from odv import data_to_dict, write_prof_dict_csv, write_prof_dict_xls
-from odv import data_to_prof_dict, write_prof_dict_xls
+import odv
+from odv import (
+    setup_logging, load_timetable, data_to_prof_dict, write_prof_dict_xls,
+    Manifest, pop_option, pop_profile,
+    )
 
 progname = os.path.basename(__file__)
 
 def main(csv_in,
          csv_out="out/full-timetable.csv",
-         xls_out="out/full-timetable.xls"):
+         xls_out="out/full-timetable.xls",
+         jobs=1):
 
     # Questa funzione è l'entry point del modulo, sia nel senso che è
     # la funzione chiamata nel blocco "if __name__ ..." sia nel senso
     # che è la funzione chiamabile da un altro file dopo aver
-    # importato questo come modulo.
+    # importato questo come modulo.  CSV_IN può essere anche un
+    # Timetable già caricato (vedi odv.load_timetable).
 
-    prof_dict = data_to_prof_dict(csv_in)
+    tt = load_timetable(csv_in)
+    prof_dict = data_to_prof_dict(tt)
+    spans = tt.teachers.spans() if odv.MERGE_CELLS else None
+    manifest = Manifest()
     # write_prof_dict_csv(prof_dict, csv_out)
-    write_prof_dict_xls(prof_dict, xls_out)
+    write_prof_dict_xls(prof_dict, xls_out, manifest, jobs, spans)
+    manifest.save()
 
 def usage():
-    print(f"usage: {progname} export-csv-file [output-csv-file]")
+    print(f"usage: {progname} [--jobs N] [--profile] [--cprofile] "
+          f"export-csv-file [output-csv-file]")
 
 if __name__ == "__main__":
 
     args = sys.argv[1:]
+    setup_logging()
+    jobs = int(pop_option(args, "--jobs", 1))
+    pop_profile(args)
     if len(args) > 2:
         usage()
         sys.exit(1)
@@ -37,4 +51,4 @@ if __name__ == "__main__":
         csv_out = args[1]
     else:
         csv_out = "out/full-timetable.csv"
-    main(csv_in, csv_out)
+    main(csv_in, csv_out, jobs=jobs)
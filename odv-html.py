@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Genera le pagine HTML dell'orario per il sito della scuola: una
+# pagina per ciascuna classe, docente e aula (nelle subdir classi,
+# docenti e aule della directory di output) e una pagina unica
+# (index.html) con tutte le tabelle e un indice per trovarle.
+
+import os
+import sys
+
+from odv import (
+    setup_logging, load_timetable, Manifest, inputs_hash, pop_option,
+    pop_profile, stage,
+    occupancy_grid, html_table, html_site, safe_file_name,
+    class_html_cell, prof_html_cell, room_html_cell,
+    CSV_INPUT,
+    )
+
+progname = os.path.basename(__file__)
+
+HTML_OUTDIR = "out/html"
+
+def timetable_grids(tt):
+
+    # [(kind, [(name, grid), ...]), ...] per classi, docenti e aule
+
+    sections = list()
+    for kind, occ, cell in (("classi", tt.classes, class_html_cell),
+                            ("docenti", tt.teachers, prof_html_cell),
+                            ("aule", tt.rooms, room_html_cell)):
+        with stage("render"):
+            sections.append((kind, [(name, occupancy_grid(occ, name, cell))
+                                    for name in occ.names]))
+    return sections
+
+def write_pages(sections, html_outdir, manifest=None):
+    for kind, grids in sections:
+        outdir = os.path.join(html_outdir, kind)
+        os.makedirs(outdir, exist_ok=True) # grant dir existence
+        files = list()
+        for name, grid in grids:
+            f = os.path.join(outdir, "%s.html" % safe_file_name(name))
+            files.append(f)
+            if manifest is not None:
+                key = inputs_hash(name, grid)
+                if not manifest.stale(f, key):
+                    continue
+                manifest.update(f, key)
+            with stage("render"):
+                text = html_table(name, grid)
+            with stage("write"), open(f, "w") as html_out:
+                html_out.write(text + "\n")
+
+        # Le pagine dei docenti (o delle aule, ...) che non ci sono più
+        # le tolgo, come in odv-class-timetable.write_html.
+
+        if manifest is not None:
+            manifest.prune(outdir, files)
+
+def write_site(sections, html_outdir, manifest=None, title="Orario"):
+    f = os.path.join(html_outdir, "index.html")
+    if manifest is not None:
+        key = inputs_hash(title, sections)
+        if not manifest.stale(f, key):
+            return
+        manifest.update(f, key)
+    with stage("render"):
+        tables = [(kind, [(name, html_table(name, grid))
+                          for name, grid in grids])
+                  for kind, grids in sections]
+        text = html_site(title, tables)
+    os.makedirs(html_outdir, exist_ok=True)
+    with stage("write"), open(f, "w") as html_out:
+        html_out.write(text)
+
+def main(csv_in, html_outdir=HTML_OUTDIR):
+    sections = timetable_grids(load_timetable(csv_in))
+    manifest = Manifest()
+    write_pages(sections, html_outdir, manifest)
+    write_site(sections, html_outdir, manifest)
+    manifest.save()
+
+def usage():
+    print(f"usage: {progname} [--outdir DIR] [--profile] [--cprofile] "
+          f"[export-csv-file]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    html_outdir = pop_option(args, "--outdir", HTML_OUTDIR)
+    pop_profile(args)
+    if len(args) > 1:
+        usage()
+        sys.exit(1)
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    csv_in = args and args[0] or CSV_INPUT
+    main(csv_in, html_outdir)
@@ -0,0 +1,264 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Un piccolo server HTTP per l'orario: legge l'export una volta sola
+# e risponde dalla memoria, senza passare dai file in out/.
+#
+#   /                             indice (HTML)
+#   /classi/1A.html               orario di una classe (anche docenti
+#   /classi/1A.json               e aule, con i nomi di safe_file_name)
+#   /classi.json                  elenco delle classi (docenti, aule)
+#   /free.html?kind=docenti&day=mar&hour=3&hours=2&match=Man
+#   /free.json?kind=aule&with=Mediateca&with=Palestra_1
+#
+# (in with= va il nome, anche quello degli URL, o una sua parte, vedi
+# odv-free.find_name).
+#
+# Le pagine delle classi, dei docenti e delle aule sono tutte
+# preparate (già codificate, con il loro ETag) quando si carica
+# l'export: alla mattina, quando arrivano tutti insieme, si tratta
+# solo di spedire dei bytes, o un 304 se il browser ha già la pagina
+# (If-None-Match).  Le domande su chi è libero (vedi odv-free.py)
+# vengono calcolate al volo con le bitmask di odv.Availability.
+#
+# Quando l'export cambia (vedi odv-watch.py) viene riletto in un
+# thread a parte e le nuove pagine prendono il posto delle vecchie
+# tutte insieme; se la lettura fallisce si continua con le vecchie.
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import threading
+import importlib
+from collections import namedtuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, unquote, parse_qs
+
+import odv
+from odv import (
+    setup_logging, load_timetable, pop_option, pop_profile, debug, info,
+    error, entity_name, safe_file_name, html_table, html_text, slot_name,
+    HTML_PAGE, CSV_INPUT, DAYS_SHIFT, START_TIMES, LESSONS_PER_DAY,
+    )
+
+progname = os.path.basename(__file__)
+
+html_pages = importlib.import_module("odv-html")
+free = importlib.import_module("odv-free")
+watch = importlib.import_module("odv-watch")
+
+HOST = "127.0.0.1"
+PORT = 8000
+TITLE = "Orario"
+RELOAD_INTERVAL = 2.0                   # seconds between two looks
+
+AVAILABILITY = {"classi": "classes", "docenti": "teachers", "aule": "rooms"}
+
+Response = namedtuple("Response", "body type etag")
+
+def response(body, type="text/html; charset=utf-8"):
+    if not isinstance(body, bytes):
+        body = body.encode("utf-8")
+    return Response(body, type, '"%s"' % hashlib.sha1(body).hexdigest())
+
+def json_response(data):
+    return response(json.dumps(data, ensure_ascii=False, indent=1),
+                    "application/json; charset=utf-8")
+
+def html_page(title, index="", body=""):
+    return response(HTML_PAGE % {"title": html_text(title),
+                                 "index": index, "body": body})
+
+def grid_json(kind, name, grid):
+    return {"kind": kind, "name": entity_name(name),
+            "days": list(DAYS_SHIFT),
+            "hours": START_TIMES[:LESSONS_PER_DAY],
+            "grid": [[list(c) if c else None for c in row] for row in grid]}
+
+class Site:
+
+    # Tutte le risposte "fisse" per un export: {path: Response}.
+
+    def __init__(self, tt, title=TITLE):
+        self.tt = tt
+        self.title = title
+        self.pages = dict()
+        index = list()
+        for kind, grids in html_pages.timetable_grids(tt):
+            tt.availability(AVAILABILITY[kind]) # ready before the threads
+            links = list()
+            names = list()
+            for name, grid in grids:
+                path = f"/{kind}/{safe_file_name(name)}"
+                self.pages[path + ".html"] = html_page(
+                    entity_name(name), body=html_table(name, grid))
+                self.pages[path + ".json"] = json_response(
+                    grid_json(kind, name, grid))
+                links.append(f'<a href="{path}.html">'
+                             f'{html_text(entity_name(name))}</a>')
+                names.append({"name": entity_name(name), "url": path})
+            self.pages[f"/{kind}.json"] = json_response(names)
+            index.append(f"<h2>{html_text(kind.capitalize())}</h2>\n"
+                         f"<p>{' '.join(links)}</p>\n")
+        self.pages["/"] = self.pages["/index.html"] = html_page(
+            title, "".join(index))
+        debug(f"{len(self.pages)} pages ready")
+
+    def free(self, query):
+
+        # QUERY = parse_qs(...); ValueError if it does not make sense
+
+        kind = query.get("kind", ["docenti"])[0]
+        if kind not in AVAILABILITY:
+            raise ValueError(f"Bad kind '{kind}'")
+        hours = free.parse_hours(query.get("hours", ["1"])[0])
+        if "with" in query:
+            runs = free.free_with(self.tt, AVAILABILITY[kind],
+                                  query["with"], hours)
+            return {"kind": kind, "with": query["with"], "hours": hours,
+                    "free": [{"slot": slot_name(first), "hours": length}
+                             for first, length in runs]}
+        if "day" not in query or "hour" not in query:
+            raise ValueError("Missing day and hour (or with)")
+        day = free.parse_day(query["day"][0])
+        hour = free.parse_hour(query["hour"][0])
+        match = query.get("match", [None])[0]
+        return {"kind": kind, "slot": slot_name(day * LESSONS_PER_DAY + hour),
+                "hours": hours,
+                "free": free.free_at(self.tt, AVAILABILITY[kind], day, hour,
+                                     hours, match)}
+
+def free_html(data):
+    if "with" in data:
+        title = f"{', '.join(data['with'])}: ore libere ({data['hours']}h)"
+        items = [f"{r['slot']} ({r['hours']}h)" for r in data["free"]]
+    else:
+        title = f"{data['kind'].capitalize()} liberi {data['slot']} ({data['hours']}h)"
+        items = data["free"]
+    body = "<ul>\n%s</ul>\n" % "".join(f"<li>{html_text(i)}</li>\n"
+                                       for i in items)
+    return html_page(title, body=body)
+
+class Handler(BaseHTTPRequestHandler):
+
+    server_version = "odv-serve"
+
+    def do_GET(self):
+        self.reply(self.find())
+
+    def do_HEAD(self):
+        self.reply(self.find(), body=False)
+
+    def find(self):
+        site = self.server.site         # the one of this request
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        r = site.pages.get(path)
+        if r is not None:
+            return r
+        if path in ("/free.json", "/free.html"):
+            try:
+                data = site.free(parse_qs(url.query))
+            except ValueError as e:
+                return 400, str(e)
+            if path == "/free.json":
+                return json_response(data)
+            return free_html(data)
+        return 404, f"Not found: {path}"
+
+    def reply(self, r, body=True):
+        if not isinstance(r, Response):
+            self.send_error(r[0], None, r[1])
+            return
+        tags = self.headers.get("If-None-Match")
+        if tags and (tags.strip() == "*" or
+                     r.etag in [t.strip() for t in tags.split(",")]):
+            self.send_response(304)
+            self.send_header("ETag", r.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", r.type)
+        self.send_header("Content-Length", str(len(r.body)))
+        self.send_header("ETag", r.etag)
+        self.send_header("Cache-Control", "no-cache") # always revalidate
+        self.end_headers()
+        if body:
+            self.wfile.write(r.body)
+
+    def log_message(self, format, *args):
+        debug(f"{self.address_string()} {format % args}")
+
+def load_site(csv_in, title=TITLE):
+    # CSV_IN can also be an already loaded Timetable
+    start = time.perf_counter()
+    site = Site(load_timetable(csv_in), title)
+    info(f"'{site.tt.source}': {len(site.tt.records)} rows, "
+         f"{len(site.pages)} pages in {time.perf_counter() - start:.2f}s")
+    return site
+
+def reloader(server, csv_in, interval=RELOAD_INTERVAL):
+
+    # Nel thread di "hot reload": come odv-watch.py, ma invece di
+    # scrivere i file si sostituisce il Site del server (se i record
+    # sono cambiati, vedi batch.changed_fields).
+
+    paths = watch.sources(csv_in)
+    last = watch.snapshot(paths)
+    while True:
+        time.sleep(interval)
+        if watch.snapshot(paths) == last:
+            continue
+        last = watch.settle(paths)
+        try:
+            tt = load_timetable(csv_in)
+            if watch.batch.changed_fields(server.site.tt, tt):
+                server.site = load_site(tt, server.site.title)
+        except Exception as e:
+            error(f"{csv_in}: {type(e).__name__}: {e}")
+
+def main(csv_in=CSV_INPUT, host=HOST, port=PORT, reload=True):
+
+    logging.getLogger().setLevel(logging.INFO)
+    odv.PROF_PAIRS = watch.batch.prof_pairs_for(csv_in)
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.site = load_site(csv_in)
+    if reload:
+        threading.Thread(target=reloader, args=(server, csv_in),
+                         daemon=True).start()
+    info(f"serving '{csv_in}' on http://{host}:{server.server_port}/")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def usage():
+    print(f"usage: {progname} [--host HOST] [--port N] [--no-reload] "
+          f"[--profile] [--cprofile] [export-csv-file]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    pop_profile(args)
+    host = pop_option(args, "--host", HOST)
+    port = int(pop_option(args, "--port", PORT))
+    reload = "--no-reload" not in args
+    if not reload:
+        args.remove("--no-reload")
+    if len(args) > 1:
+        usage()
+        sys.exit(1)
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    csv_in = args and args[0] or CSV_INPUT
+    try:
+        main(csv_in, host, port, reload)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Importa uno o più file di export (anche directory, come per
+# odv-batch.py) nel database SQLite (vedi odv.sqlite_connect), e fa
+# le domande al database.  Un export già importato (stesso
+# contenuto) non viene importato di nuovo.
+#
+#   odv-sqlite.py data/2020-*/export.csv        importa
+#   odv-sqlite.py --list                        gli export importati
+#   odv-sqlite.py --sql "SELECT day_name, start, CLASSE, MAT_COD
+#                        FROM teacher_lessons
+#                        WHERE teacher = 'Manini, Luca' AND export = 3"
+#
+# I programmi possono poi leggere dal database al posto del file di
+# export: odv-html.py out/timetable.sqlite (l'ultimo export) oppure
+# odv-html.py out/timetable.sqlite#3 (l'export numero 3).
+
+import os
+import sys
+import time
+import logging
+import importlib
+
+import odv
+from odv import (
+    setup_logging, Timetable, sqlite_connect, sqlite_imported, sqlite_import,
+    export_sha1, pop_option, pop_profile, SQLITE_FILE,
+    )
+
+progname = os.path.basename(__file__)
+
+batch = importlib.import_module("odv-batch")
+
+def import_exports(exports, db=SQLITE_FILE):
+    con = sqlite_connect(db)
+    try:
+        for csv_in in exports:
+            start = time.perf_counter()
+            sha1 = export_sha1(csv_in)
+
+            # Un export già importato non serve neanche leggerlo.
+
+            export = sqlite_imported(con, sha1)
+            if export is not None:
+                print(f"{export:4d} {csv_in}: already imported")
+                continue
+            odv.PROF_PAIRS = batch.prof_pairs_for(csv_in)
+            tt = Timetable.from_csv(csv_in)
+            export = sqlite_import(con, tt, csv_in, sha1)
+            print(f"{export:4d} {csv_in}: {len(tt.records)} rows "
+                  f"({time.perf_counter() - start:.2f}s)")
+    finally:
+        con.close()
+
+def list_exports(db=SQLITE_FILE):
+    con = sqlite_connect(db)
+    for row in con.execute("SELECT id, substr(sha1, 1, 10), imported, "
+                           "rows, source FROM exports ORDER BY id"):
+        print("%4d %s %s %7d %s" % row)
+    con.close()
+
+def query(sql, db=SQLITE_FILE):
+    con = sqlite_connect(db)
+    start = time.perf_counter()
+    cur = con.execute(sql)
+    if cur.description:
+        print("\t".join(d[0] for d in cur.description))
+    n = 0
+    for row in cur:
+        print("\t".join("" if v is None else str(v) for v in row))
+        n += 1
+    print(f"{n} rows ({1000 * (time.perf_counter() - start):.1f}ms)",
+          file=sys.stderr)
+    con.close()
+
+def usage():
+    print(f"usage: {progname} [--db FILE] [--profile] "
+          f"export-csv-file-or-dir [...]\n"
+          f"       {progname} [--db FILE] --list\n"
+          f"       {progname} [--db FILE] --sql QUERY")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    pop_profile(args)
+    db = pop_option(args, "--db", SQLITE_FILE)
+    sql = pop_option(args, "--sql")
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    logging.getLogger().setLevel(logging.WARNING)
+    if sql is not None and not args:
+        query(sql, db)
+    elif args == ["--list"]:
+        list_exports(db)
+    elif args and sql is None:
+        import_exports(batch.find_exports(args), db)
+    else:
+        usage()
+        sys.exit(1)
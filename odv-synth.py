@@ -0,0 +1,303 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Generatore di file di export "sintetici", con la stessa struttura
+# (e codifica UTF-16) di quelli prodotti da EDT, per fare prove e
+# misure senza usare il vero data/export.csv (che contiene dati
+# personali).  I dati sono inventati ma "realistici": ogni classe ha
+# il suo monte ore settimanale, con lezioni di una o due ore, ci sono
+# righe multiclasse (tipo "[2G/H SPA]"), righe con due docenti
+# ("Carli, Valduga" / "Paolo, Gianluca") e le solite aule logorroiche.
+#
+# La dimensione si sceglie con il numero di scuole (--schools) o con
+# una delle scale predefinite (--scale school, district, province).
+# Ogni scuola ha le sue classi e le sue aule, e nessuna lezione si
+# sovrappone a un'altra (odv-clashes.py non trova niente) a qualunque
+# scala.
+# Insieme all'export viene scritto anche il file delle coppie di
+# docenti (vedi odv.load_prof_pairs_dic) che serve per leggerlo.
+
+import os
+import sys
+import csv
+import random
+
+from odv import pop_option, DAYS_SHIFT, START_TIMES
+
+progname = os.path.basename(__file__)
+
+SCALES = {"school": 1, "district": 10, "province": 40}
+CLASSES_PER_SCHOOL = 55
+HOURS_PER_DAY = 6                       # 07h50 ... 12h15
+
+HEADERS = """
+    NUMERO DURATA FREQUENZA MAT_COD MAT_NOME
+    DOC_COGN DOC_NOME CLASSE AULA PERIODICITA
+    SPECIFICA CO_DOC COEFF GIORNO ORA_INIZIO ALUNNI
+""".split()
+
+# Materie con il nome "ufficiale" (quello che compare nell'export) e
+# le ore settimanali per ciascun anno di corso.
+
+SUBJECTS = {
+    "ITA": ("Lingua e Letteratura Italiana",     (4, 4, 4, 4, 4)),
+    "LAT": ("Lingua e Cultura Latina",           (3, 3, 3, 3, 3)),
+    "ING": ("Lingua e Cultura Straniera Inglese", (3, 3, 3, 3, 3)),
+    "STG": ("Storia e Geografia",                (3, 3, 0, 0, 0)),
+    "STO": ("Storia",                            (0, 0, 2, 2, 2)),
+    "FIL": ("Filosofia",                         (0, 0, 3, 3, 3)),
+    "MAT": ("Matematica",                        (5, 5, 4, 4, 4)),
+    "FIS": ("Fisica",                            (2, 2, 3, 3, 3)),
+    "SCI": ("Scienze Naturali",                  (2, 2, 3, 3, 3)),
+    "DIS": ("Disegno e Storia dell'arte",        (2, 2, 2, 2, 2)),
+    "MOT": ("Scienze Motorie e Sportive",        (2, 2, 2, 2, 2)),
+    "IRC": ("Religione Cattolica",               (1, 1, 1, 1, 1)),
+    "INF": ("Informatica",                       (2, 2, 0, 0, 0)),
+}
+LANGUAGES = {"SPA": "Lingua e Cultura Straniera Spagnolo",
+             "TED": "Lingua e Cultura Straniera Tedesco"}
+LANGUAGE_HOURS = 2
+
+SURNAMES = """
+    Rossi Bianchi Ferrari Esposito Romano Colombo Ricci Marino Greco
+    Bruno Gallo Conti DeLuca Mancini Costa Giordano Rizzo Lombardi
+    Moretti Barbieri Fontana Santoro Mariani Rinaldi Caruso Ferrara
+    Galli Martini Leone Longo Gentile Martinelli Vitale Lombardo Serra
+    Coppola DeSantis Marchetti Parisi Villa Conte Ferraro Ferri Fabbri
+    Bianco Marini Grasso Valentini Messina Sala Gatti Pellegrini Palumbo
+    Sanna Farina Rizzi Monti Cattaneo Moro Silvestri Gruber Valduga
+    Gubert Nanut Carli Manini Zanella Pedrotti Dalpiaz Tomasi Moser
+""".split()
+NAMES = """
+    Luca Marco Paolo Giulia Chiara Anna Francesca Andrea Stefano Elena
+    Sara Matteo Davide Laura Simone Michela Evelin Gianluca Silvia Fabio
+""".split()
+
+def teacher_name(i):
+    # nomi diversi per tutti: dopo il primo giro si aggiunge un numero
+    surname = SURNAMES[i % len(SURNAMES)]
+    if i >= len(SURNAMES):
+        surname += str(i // len(SURNAMES))
+    return surname, NAMES[(i * 7) % len(NAMES)]
+
+def section_name(n):
+    # A..Z e poi AA, AB, ... (come le colonne di un foglio di calcolo),
+    # così le classi di più scuole non si confondono mai (vedi
+    # odv.class_codes)
+    name = ""
+    n += 1
+    while n:
+        n, r = divmod(n - 1, 26)
+        name = chr(ord("A") + r) + name
+    return name
+
+class School:
+
+    def __init__(self, rng, index, classes, teacher_base):
+        self.rng = rng
+        self.index = index
+        self.teachers = list()
+        self.teacher_base = teacher_base
+        self.busy = dict()              # teacher/class/room -> set(slots)
+        self.site = f" sede {index + 1}" if index else ""
+        self.classes = list()           # [(year, section, class), ...]
+        per_year = max(1, classes // 5)
+        for n in range(classes):
+            year = n % 5 + 1
+            section = section_name(index * per_year + n // 5)
+            suffix = "s" if n % 2 else "sa"
+            self.classes.append((year, section, f"{year}{section}{suffix}"))
+
+    def room(self, name, code):
+        # le aule "speciali" (palestre, laboratori, ...) di ogni scuola
+        # sono sue: "Palestra 1 sede 2 (Est)"
+        return f"{name}{self.site} ({code})"
+
+    def new_teacher(self):
+        t = teacher_name(self.teacher_base + len(self.teachers))
+        self.teachers.append(t)
+        return t
+
+    def free(self, key, slots):
+        return not (self.busy.setdefault(key, set()) & set(slots))
+
+    def take(self, key, slots):
+        self.busy.setdefault(key, set()).update(slots)
+
+    def place(self, keys, size):
+
+        # Un giorno e un'ora di inizio in cui tutte le KEYS (classe,
+        # docente, aula) sono libere per SIZE ore, None se non ci sono:
+        # mai una sovrapposizione (se no odv-clashes.py le trova tutte).
+
+        options = [(d, h) for d in range(len(DAYS_SHIFT))
+                   for h in range(HOURS_PER_DAY - size + 1)]
+        self.rng.shuffle(options)
+        for d, h in options:
+            slots = [(d, h + i) for i in range(size)]
+            if all(self.free(k, slots) for k in keys):
+                for k in keys:
+                    self.take(k, slots)
+                return d, h
+        return None
+
+    def join(self, key, d, h, size):
+
+        # Aggiunge KEY (un secondo docente) alla lezione già messa in
+        # D, H, ma solo se è libero.
+
+        slots = [(d, h + i) for i in range(size)]
+        if not self.free(key, slots):
+            return False
+        self.take(key, slots)
+        return True
+
+    def place_lesson(self, klass, prof, where, size):
+
+        # Come place per una lezione di KLASS con PROF in WHERE (None
+        # per l'aula della classe, che è solo sua).  Se non c'è posto si
+        # prova con un'ora sola, poi nell'aula della classe e infine con
+        # un docente nuovo: il monte ore di una classe è meno delle ore
+        # della settimana, quindi un'ora libera c'è sempre.  Restituisce
+        # (prof, where, size, d, h).
+
+        tries = [(prof, where, size), (prof, where, 1), (prof, None, 1)]
+        for prof, where, size in tries:
+            keys = [klass, prof] + ([where] if where else [])
+            at = self.place(keys, size)
+            if at is not None:
+                return (prof, where, size, *at)
+        prof = self.new_teacher()
+        return (prof, None, 1, *self.place([klass, prof], 1))
+
+def make_export(schools=1, classes_per_school=CLASSES_PER_SCHOOL, seed=0):
+
+    # Restituisce (rows, pairs): le righe dell'export (liste di 16
+    # stringhe) e le coppie di docenti delle righe con due docenti.
+
+    rng = random.Random(seed)
+    days = list(DAYS_SHIFT)
+    rows = list()
+    pairs = dict()
+    teacher_base = 0
+
+    def add(size, mat, mat_name, prof, klass, room, day, start, studs):
+        rows.append([str(len(rows) + 1), f"{size}h00", "S", mat, mat_name,
+                     prof[0], prof[1], klass, room, "S", "ss", "N", "50/60",
+                     days[day], START_TIMES[start], str(studs)])
+
+    for si in range(schools):
+        school = School(rng, si, classes_per_school, teacher_base)
+
+        # Ogni docente insegna una materia in più classi, fino a circa
+        # 18 ore la settimana.
+
+        load = dict()
+        def teacher_for(mat, hours):
+            for t, (m, h) in load.items():
+                if m == mat and h + hours <= 18:
+                    load[t] = (m, h + hours)
+                    return t
+            t = school.new_teacher()
+            load[t] = (mat, hours)
+            return t
+
+        # Righe multiclasse: due classi dello stesso anno si dividono
+        # tra SPA e TED (stessa ora, due docenti, due aule).  Vanno
+        # messe per prime, quando le due classi hanno ancora un'ora
+        # libera in comune; se i docenti sono già impegnati se ne
+        # prendono due nuovi.
+
+        cc = school.classes
+        for i in range(0, len(cc) - 5, 10):
+            (year, s0, k0), (_, s1, k1) = cc[i], cc[i + 5]
+            multi = f"{year}{s0}/{s1}"
+            for n in range(LANGUAGE_HOURS):
+                profs = [teacher_for(m, 1) for m in LANGUAGES]
+                rooms = [school.room("<Aule per gruppi>Mediateca", "0.45"),
+                         school.room("<Aule per gruppi>Aula proiezioni",
+                                     "0.22")]
+                at = school.place([k0, k1] + profs + rooms, 1)
+                if at is None:
+                    profs = [school.new_teacher() for m in LANGUAGES]
+                    at = school.place([k0, k1] + profs + rooms, 1)
+                d, h = at
+                for (mat, mat_name), prof, room in zip(LANGUAGES.items(),
+                                                       profs, rooms):
+                    add(1, mat, mat_name, prof, f"[{multi} {mat}]", room,
+                        d, h, 12)
+
+        for year, _, klass in school.classes:
+            room = f"Aula {klass} ({rng.randint(0, 3)}.{rng.randint(10, 60)})"
+            for mat, (mat_name, hours) in SUBJECTS.items():
+                hours = hours[year - 1]
+                if not hours:
+                    continue
+                prof = teacher_for(mat, hours)
+                where = room
+                if mat == "MOT":
+                    where = school.room(
+                        f"<Palestre>Palestra {rng.randint(1, 3)}", "Est")
+                elif mat == "INF":
+                    where = school.room(
+                        f"<Lab. Informatica>Lab. Informatica {rng.randint(1, 2)}",
+                        f"2° p 2.0{rng.randint(1, 4)}")
+                while hours > 0:
+                    size = 2 if hours >= 2 and rng.random() < 0.4 else 1
+                    who, at, size, d, h = school.place_lesson(
+                        klass, prof, where if where != room else None, size)
+                    hours -= size
+                    if rng.random() < 0.03:       # compresenza
+                        other = rng.choice(school.teachers)
+                        if other != who and school.join(other, d, h, size):
+                            pairs[(who[0], other[0])] = who[0]
+                            who = (f"{who[0]}, {other[0]}",
+                                   f"{who[1]}, {other[1]}")
+                    add(size, mat, mat_name, who, klass, at or room, d, h, 25)
+
+        teacher_base += len(school.teachers)
+
+    return rows, pairs
+
+def write_export(rows, csv_out, encoding="utf-16"):
+    with open(csv_out, "w", newline="", encoding=encoding) as out:
+        writer = csv.writer(out, delimiter=";", lineterminator="\r\n")
+        writer.writerow(HEADERS)
+        writer.writerows(rows)
+
+def write_pairs(pairs, pairs_out):
+    with open(pairs_out, "w") as out:
+        for (first, second), choice in sorted(pairs.items()):
+            out.write(f"{first}, {second} = {choice}\n")
+
+def main(csv_out, pairs_out=None, schools=1, seed=0, encoding="utf-16"):
+    rows, pairs = make_export(schools, seed=seed)
+    write_export(rows, csv_out, encoding)
+    write_pairs(pairs, pairs_out or csv_out + ".pairs.txt")
+    return rows
+
+def usage():
+    print(f"usage: {progname} [--scale school|district|province] "
+          f"[--schools N] [--seed N] [--utf8] [--pairs FILE] "
+          f"output-csv-file")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    scale = pop_option(args, "--scale", "school")
+    schools = int(pop_option(args, "--schools", SCALES.get(scale, 0)))
+    seed = int(pop_option(args, "--seed", 0))
+    pairs_out = pop_option(args, "--pairs")
+    encoding = "utf-16"
+    if "--utf8" in args:
+        args.remove("--utf8")
+        encoding = "utf-8"
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    if len(args) != 1 or scale not in SCALES or schools < 1:
+        usage()
+        sys.exit(1)
+    rows = main(args[0], pairs_out, schools, seed, encoding)
+    print(f"{len(rows)} rows written to '{args[0]}'")
@@ -0,0 +1,150 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Modalità "watch": resta in esecuzione e, ogni volta che il file di
+# export cambia (di solito perché qualcuno ha rifatto l'export da
+# EDT), rigenera tutti gli output (gli stessi di odv-batch.py, in
+# --outdir).  Si può controllare anche una directory: in quel caso
+# ogni export (file .csv) ha la sua subdir di output, come con
+# odv-batch.py.
+#
+# EDT (o la copia dalla chiavetta...) scrive il file un po' alla
+# volta, quindi dopo una modifica si aspetta che dimensione e data
+# restino ferme per DEBOUNCE secondi prima di leggerlo; se la lettura
+# fallisce lo stesso si riprova alla modifica successiva.
+#
+# Il programma resta "caldo": moduli importati e normalizzazioni già
+# fatte (vedi odv.class_codes, ...) restano in memoria, e così il
+# Timetable dell'ultimo export.  Il nuovo export viene confrontato
+# con quello, record per record: se non è cambiato niente (un
+# "touch", una copia dello stesso file, le stesse coppie di docenti)
+# non si fa niente, altrimenti si rifà tutto (come in odv-batch.py)
+# e il manifest (vedi odv.Manifest) fa riscrivere solo i file le cui
+# lezioni sono cambiate.  Per un export di una scuola si passa da EDT all'orario
+# aggiornato in un paio di secondi.
+
+import os
+import sys
+import time
+import logging
+import importlib
+
+import odv
+from odv import (
+    setup_logging, load_timetable, Manifest, pop_option, pop_profile, error,
+    CSV_INPUT,
+    )
+
+progname = os.path.basename(__file__)
+
+batch = importlib.import_module("odv-batch")
+
+OUTDIR = "out"
+INTERVAL = 1.0                          # seconds between two looks
+DEBOUNCE = 0.5                          # the files must be still this long
+
+def targets(src, outdir):
+    # [(csv_in, outdir), ...] for a file or a directory of exports
+    if not os.path.isdir(src):
+        return [(src, outdir)]
+    exports = batch.find_exports([src])
+    return [(csv_in, os.path.join(outdir, name))
+            for csv_in, name in zip(exports, batch.job_names(exports))]
+
+def sources(csv_in):
+    # the files the outputs of CSV_IN depend on
+    return [csv_in, batch.prof_pairs_for(csv_in)]
+
+def snapshot(paths):
+    # {path: (size, mtime)} of the existing PATHS
+    snap = dict()
+    for p in paths:
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        snap[p] = (st.st_size, st.st_mtime_ns)
+    return snap
+
+def settle(paths, debounce=DEBOUNCE):
+    # wait until PATHS stop changing, return their snapshot
+    snap = snapshot(paths)
+    while True:
+        time.sleep(debounce)
+        new = snapshot(paths)
+        if new == snap:
+            return snap
+        snap = new
+
+def rebuild(csv_in, outdir, previous=None):
+
+    # Gli output di CSV_IN; PREVIOUS è il Timetable della volta prima
+    # (i suoi output sono in OUTDIR): se i record sono gli stessi
+    # (vedi batch.changed_fields) non si rifà niente.  Restituisce il nuovo
+    # Timetable, oppure None (e lascia tutto com'è) se l'export non si
+    # riesce a leggere.
+
+    start = time.perf_counter()
+    odv.PROF_PAIRS = batch.prof_pairs_for(csv_in)
+    manifest = Manifest(os.path.join(outdir, "manifest.json"))
+    try:
+        tt = load_timetable(csv_in)
+        if not batch.changed_fields(previous, tt):
+            return tt
+        batch.publish(tt, outdir, manifest)
+    except Exception as e:
+        error(f"{csv_in}: {type(e).__name__}: {e}")
+        return None
+    print(f"{time.strftime('%H:%M:%S')} {csv_in}: {len(tt.records)} rows, "
+          f"{len(manifest.regenerated)} files regenerated, "
+          f"{len(manifest.skipped)} unchanged "
+          f"({time.perf_counter() - start:.2f}s)", flush=True)
+    return tt
+
+def main(src=CSV_INPUT, outdir=OUTDIR, interval=INTERVAL, debounce=DEBOUNCE,
+         once=False):
+
+    logging.getLogger().setLevel(logging.WARNING)
+    done = dict()                       # csv_in -> Timetable last done
+    last = None
+    while True:
+        todo = targets(src, outdir)
+        paths = [p for csv_in, _ in todo for p in sources(csv_in)]
+        if snapshot(paths) != last:
+            last = settle(paths, debounce)
+            for csv_in, out in todo:
+                tt = rebuild(csv_in, out, done.get(csv_in))
+                if tt is not None:
+                    done[csv_in] = tt
+        if once:
+            return
+        time.sleep(interval)
+
+def usage():
+    print(f"usage: {progname} [--outdir DIR] [--interval S] [--debounce S] "
+          f"[--once] [--profile] [--cprofile] [export-csv-file-or-dir]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    outdir = pop_option(args, "--outdir", OUTDIR)
+    odv.PROFILE_FILE = os.path.join(outdir, "profile.json")
+    pop_profile(args)
+    interval = float(pop_option(args, "--interval", INTERVAL))
+    debounce = float(pop_option(args, "--debounce", DEBOUNCE))
+    once = "--once" in args
+    if once:
+        args.remove("--once")
+    if len(args) > 1:
+        usage()
+        sys.exit(1)
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    src = args and args[0] or CSV_INPUT
+    try:
+        main(src, outdir, interval, debounce, once)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,44 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Genera un unico file XLS con tutti i fogli (tabellone dei prof,
+# orario delle classi, aule, materie e carico di docenti e classi),
+# leggendo il file di export una volta sola.
+
+import os
+import sys
+
+from odv import (
+    setup_logging, write_workbook, Manifest, pop_option, pop_profile,
+    CSV_INPUT,
+    )
+
+progname = os.path.basename(__file__)
+
+def main(csv_in, xls_out="out/timetable.xlsx", jobs=1):
+    manifest = Manifest()
+    write_workbook(csv_in, xls_out, manifest, jobs)
+    manifest.save()
+
+def usage():
+    print(f"usage: {progname} [--jobs N] [--profile] [--cprofile] "
+          f"[export-csv-file [output-xls-file]]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    jobs = int(pop_option(args, "--jobs", 1))
+    pop_profile(args)
+    if len(args) > 2:
+        usage()
+        sys.exit(1)
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    csv_in = args and args[0] or CSV_INPUT
+    if len(args) == 2:
+        main(csv_in, args[1], jobs=jobs)
+    else:
+        main(csv_in, jobs=jobs)
@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+
+# author: Luca Manini (luca.manini@liceodavincitn.it)
+
+# Il carico settimanale dei docenti (o delle classi): per ciascuno le
+# ore, i "buchi" (ore libere tra la prima e l'ultima lezione di un
+# giorno), i giorni con lezione, la fila più lunga di ore consecutive
+# e, giorno per giorno, ore/buchi.  I numeri vengono da odv.Workload
+# (gli stessi dei fogli "Carico docenti" e "Carico classi" di
+# odv-workbook.py).
+#
+#   odv-workload.py                         docenti, in ordine di nome
+#   odv-workload.py --sort buchi            prima chi ha più buchi
+#   odv-workload.py --classes --csv         classi, in CSV
+
+import os
+import sys
+import logging
+
+from odv import (
+    setup_logging, load_timetable, workload_rows, pop_option, pop_profile,
+    CSV_INPUT, DAYS_SHIFT, DAYS_PER_WEEK, WORKLOAD_WEEK, WORKLOAD_DAY,
+    )
+
+progname = os.path.basename(__file__)
+
+KINDS = {"--teachers": "teachers", "--classes": "classes", "--rooms": "rooms"}
+SORTS = {"nome": None, "ore": 1, "buchi": 2, "giorni": 3, "fila": 4}
+
+def sorted_rows(rows, sort=None):
+    column = SORTS[sort or "nome"]
+    if column is None:
+        return rows
+    return sorted(rows, key=lambda r: -r[column])
+
+def day_cell(row, d):
+    # "5/1" (ore/buchi) or "-"
+    base = 1 + len(WORKLOAD_WEEK) + d * len(WORKLOAD_DAY)
+    if row[base] is None:
+        return "-"
+    return f"{row[base]}/{row[base + 1]}"
+
+def text_lines(rows):
+    days = [d[:3].capitalize() for d in DAYS_SHIFT]
+    yield (f"{'':30s}" + "".join(f"{h:>7s}" for h in WORKLOAD_WEEK) +
+           "".join(f"{d:>6s}" for d in days) + "\n")
+    for r in rows:
+        yield (f"{r[0][:30]:30s}" + "".join(f"{v:7d}" for v in r[1:5]) +
+               "".join(f"{day_cell(r, d):>6s}" for d in range(DAYS_PER_WEEK))
+               + "\n")
+
+def csv_lines(rows):
+    import csv
+    out = csv.writer(sys.stdout, lineterminator="\n")
+    out.writerow(["Nome", *WORKLOAD_WEEK,
+                  *[f"{d} {c}" for d in DAYS_SHIFT for c in WORKLOAD_DAY]])
+    out.writerows(["" if v is None else v for v in r] for r in rows)
+
+def main(csv_in=CSV_INPUT, kind="teachers", sort=None, as_csv=False):
+    logging.getLogger().setLevel(logging.WARNING)
+    tt = load_timetable(csv_in)
+    rows = sorted_rows(workload_rows(tt.workload(kind)), sort)
+    if as_csv:
+        csv_lines(rows)
+    else:
+        sys.stdout.writelines(text_lines(rows))
+    return rows
+
+def usage():
+    print(f"usage: {progname} [--teachers|--classes|--rooms] "
+          f"[--sort {'|'.join(SORTS)}] [--csv] [--profile] [--cprofile] "
+          f"[export-csv-file]")
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    setup_logging()
+    pop_profile(args)
+    sort = pop_option(args, "--sort")
+    kind = "teachers"
+    for k in KINDS:
+        if k in args:
+            args.remove(k)
+            kind = KINDS[k]
+    as_csv = "--csv" in args
+    if as_csv:
+        args.remove("--csv")
+    if len(args) > 1 or sort not in (None, *SORTS):
+        usage()
+        sys.exit(1)
+    if args and args[0] in "-h --help".split():
+        usage()
+        sys.exit(0)
+    main(args and args[0] or CSV_INPUT, kind, sort, as_csv)
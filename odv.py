@@ -11,21 +11,61 @@
 # "Record" data type.
 
 from itertools import zip_longest as zip
-import csv
+import atexit
+import codecs
+import hashlib
+import html
+import importlib.util
+import io
+import json
+import marshal
+import os
+import re
+import struct
+import sys
+import time
 from collections import defaultdict, OrderedDict as ordereddict
+from contextlib import contextmanager
+from functools import cached_property, lru_cache
+from operator import attrgetter
 from recordclass import recordclass as namedtuple
-import xlsxwriter
 import logging
-logging.basicConfig(level=logging.DEBUG,
-                    format="%(levelname)s: %(message)s")
 debug = logging.debug
+info = logging.info
 error = logging.error
 
+# These programs run from cron and editor hooks many times a day, so
+# starting fast matters.  The heavy modules (numpy, xlsxwriter) are
+# loaded only when first used: a program that only writes text files
+# never pays for them.  Modules used by just one or two functions
+# (csv, sqlite3, pstats, ...) are imported there.
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+np = lazy_import("numpy")
+xlsxwriter = lazy_import("xlsxwriter")
+
+# Importing odv does not touch the logging configuration (that is up
+# to who imports it): the programs call this first thing.
+
+LOG_FORMAT = "%(levelname)s: %(message)s"
+
+def setup_logging(level=logging.DEBUG):
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
 CSV_INPUT = "data/export.csv"
 
 DELETE_MATTER = True
 MERGE_CELLS = False
-CHECK_RECORDS = True
 
 # generic data structures and functions ----------------------------
 
@@ -69,14 +109,14 @@ def make_record(row):
 # lessons each professor teaches in the whole week, so it is useful to
 # know at which "offset" weeks data start.  In the raw data file, the
 # days of the week are written using the lowercase full italian names
-# (with accents!).
+# (with accents!).  Each day takes LESSONS_PER_DAY (see below) slots.
 
 DAYS_SHIFT = {"lunedì":     0,
-              "martedì":    8,
-              "mercoledì": 16,
-              "giovedì":   24,
-              "venerdì":   32,
-              "sabato":    40}
+              "martedì":    9,
+              "mercoledì": 18,
+              "giovedì":   27,
+              "venerdì":   36,
+              "sabato":    45}
 
 def list_to_items_pos_dict(oo):
     # ["foo", 123, "bar"] -> {"foo":0, 123:1, "bar":2}
@@ -91,7 +131,6 @@ DAYS_PER_WEEK = len(DAYS_SHIFT)
 
 START_TIMES = "07h50 08h40 09h30 10h30 11h20 12h15 13h10 14h00 14h50".split()
 START_SHIFT = list_to_items_pos_dict(START_TIMES)
-START_INDEX = {t:START_TIMES.index(t) for t in START_TIMES}
 
 LESSONS_PER_DAY = len(START_SHIFT)
 LESSONS_PER_WEEK = LESSONS_PER_DAY * DAYS_PER_WEEK
@@ -102,16 +141,47 @@ LESSONS_PER_WEEK = LESSONS_PER_DAY * DAYS_PER_WEEK
 # line tools like grep or less.  That means that this program should
 # be able to read both formats, "guessing" the correct one.
 
+# Decoding the whole file just to find out its encoding (and then
+# reading it again to parse it) is a waste of time, so I only "sniff"
+# the first few bytes: a BOM tells the encoding for sure, otherwise
+# UTF-16 text without BOM is easily spotted by the null bytes of the
+# (mostly ASCII) column headers.
+
+ENCODING_SNIFF_SIZE = 4
+
+def sniff_encoding(head):
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"                 # the codec consumes the BOM
+    if len(head) >= 2 and head[0] == 0 and head[1] != 0:
+        return "utf-16-be"
+    if len(head) >= 2 and head[0] != 0 and head[1] == 0:
+        return "utf-16-le"
+    return "utf-8"
+
 def get_encoding(file):
-    for e in ["utf-8", "utf-16"]:
-        try:
-            f = open(file, encoding=e)
-            f.read()
-            f.close()
-            return e
-        except UnicodeDecodeError:
-            pass
-    raise ValueError(f"Unable to detect enconding for '{file}'")
+    with open(file, "rb") as data:
+        return sniff_encoding(data.read(ENCODING_SNIFF_SIZE))
+
+# Open the export file only once: the encoding is sniffed "peeking"
+# into the buffer of the binary stream and then the very same stream
+# is decoded incrementally while the csv module reads it.
+
+def open_export(csv_in):
+    raw = open(csv_in, "rb")
+    enc = sniff_encoding(raw.peek(ENCODING_SNIFF_SIZE)[:ENCODING_SNIFF_SIZE])
+    debug(f"Reading input file '{csv_in}', encoding with {enc}")
+    return io.TextIOWrapper(raw, encoding=enc, newline="")
+
+def read_rows(csv_in):
+    import csv
+    with open_export(csv_in) as data:
+        rows = csv.reader(data, delimiter=";")
+        next(rows, None)                # skip column headers
+        for r in rows:
+            if r:                       # skip blank lines
+                yield intern_row(r)
 
 # Qui leggo i dati grezzi e per ciascuna riga restituisco un "record",
 # ossia un oggetto con attributi (molto più comodo che una lista o una
@@ -120,36 +190,236 @@ def get_encoding(file):
 def csv_to_records(csv_in):
     get_mat_names() # to check MAT_COD'es to be in MAT_COD/MAT_NAME data file
 
-    debug("Reading input file '%s'" % csv_in)
-    enc = get_encoding(csv_in)
-    with open(csv_in, newline="", encoding=enc) as data:
-        rows = list(csv.reader(data, delimiter=";"))[1:]
-        debug(f"{len(rows)} rows found")
-        for index, r in enumerate(rows):
-            rec = make_record(r)
-            if rec.MAT_COD not in MAT_NAMES:
-                error(f"Bad mat code: {index=} {str(rec)}")
-            if rec.ORA_INIZIO not in START_TIMES:
-                error(f"Bad start time: {index=} {str(rec)}")
-
-            yield rec
+    if USE_CACHE:
+        rows = cached_rows(csv_in)
+    else:
+        rows = staged("decode", read_rows(csv_in))
+    index = -1
+    bad_mat = bad_start = 0
+    for index, r in enumerate(rows):
+        rec = make_record(r)
+        if rec.MAT_COD not in MAT_NAMES:
+            error(f"Bad mat code: {index=} {str(rec)}")
+            bad_mat += 1
+        if rec.ORA_INIZIO not in START_TIMES:
+            error(f"Bad start time: {index=} {str(rec)}")
+            bad_start += 1
+
+        yield rec
+    debug(f"{index + 1} rows found")
+    count("rows", index + 1)
+    count("bad_mat_codes", bad_mat)
+    count("bad_start_times", bad_start)
+
+# Cache of parsed exports.  The export changes only when somebody
+# re-exports from EDT, but every run of every program decodes and
+# splits it again.  So the parsed rows are saved (in the compact
+# binary "marshal" format, that loads very fast) in CACHE_DIR, using
+# as name the hash of the file content and the CACHE_VERSION, that
+# must be increased whenever the parsing code changes the rows it
+# produces.  Old entries are evicted (least recently used first) when
+# the cache grows over CACHE_MAX_BYTES; see also odv-cache.py.  The
+# cache can be shared by many processes at once (see odv-batch.py), so
+# each one writes its own temporary file and entries may disappear
+# while they are being listed or evicted.
+
+# Neither a hit nor a miss keeps the whole export in memory: the hash
+# is computed a block at a time, and the rows are stored (and loaded)
+# in chunks of CACHE_CHUNK_ROWS, each one a marshal blob preceded by
+# its length, while they stream to the reader.
+
+USE_CACHE = True
+CACHE_DIR = "out/cache"
+CACHE_VERSION = 3                       # 2: interned rows (intern_row)
+                                        # 3: in chunks
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_SUFFIX = ".rows"
+CACHE_CHUNK_ROWS = 4096
+CHUNK_HEADER = struct.Struct("<I")
+
+def cache_path(digest):
+    return os.path.join(CACHE_DIR, f"{digest}.v{CACHE_VERSION}{CACHE_SUFFIX}")
+
+def export_sha1(csv_in, block_size=1024 * 1024):
+    h = hashlib.sha1()
+    with open(csv_in, "rb") as raw:
+        for block in iter(lambda: raw.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def cached_rows(csv_in):
+    with stage("read"):
+        path = cache_path(export_sha1(csv_in))
+        try:
+            cache = open(path, "rb")
+        except OSError:
+            cache = None
+    if cache is None:
+        count("cache_misses")
+        yield from cache_store(path, staged("decode", read_rows(csv_in)))
+        return
+    with cache:
+        os.utime(path)                  # recently used
+        debug(f"{_me()}: cache hit '{path}'")
+        count("cache_hits")
+        for chunk in staged("read", cache_chunks(cache)):
+            yield from chunk
+
+def cache_chunks(cache):
+    while True:
+        header = cache.read(CHUNK_HEADER.size)
+        if not header:
+            return
+        (size,) = CHUNK_HEADER.unpack(header)
+        yield marshal.loads(cache.read(size)) # load(file) is much slower
+
+def cache_store(path, rows):
+
+    # Yields ROWS while writing them to the cache entry PATH, that
+    # appears only when all of them have been read.
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as cache:
+            chunk = list()
+            for r in rows:
+                yield r
+                chunk.append(tuple(r))
+                if len(chunk) == CACHE_CHUNK_ROWS:
+                    cache_write_chunk(cache, chunk)
+                    chunk = list()
+            if chunk:
+                cache_write_chunk(cache, chunk)
+        os.replace(tmp, path)           # never leave half written files
+    finally:
+        if os.path.exists(tmp):         # the reader stopped early
+            os.remove(tmp)
+    debug(f"{_me()}: cache stored '{path}'")
+    cache_evict()
+
+def cache_write_chunk(cache, chunk):
+    blob = marshal.dumps(tuple(chunk))
+    cache.write(CHUNK_HEADER.pack(len(blob)))
+    cache.write(blob)
+
+def cache_entries():
+    # [(path, size, last_used), ...] oldest first
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    ee = list()
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(CACHE_SUFFIX):
+            path = os.path.join(CACHE_DIR, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:   # evicted by another process
+                continue
+            ee.append((path, st.st_size, st.st_mtime))
+    return sorted(ee, key=lambda e: e[2])
+
+def cache_evict(max_bytes=None):
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+    ee = cache_entries()
+    total = sum(e[1] for e in ee)
+    removed = list()
+    for path, size, _ in ee[:-1]:       # always keep the newest one
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(path)
+    if removed:
+        debug(f"{_me()}: evicted {len(removed)} cache entries")
+    return removed
+
+def cache_clear():
+    removed = [path for path, _, _ in cache_entries()]
+    for path in removed:
+        os.remove(path)
+    debug(f"{_me()}: removed {len(removed)} cache entries")
+    return removed
 
 def _me():
     # https://www.oreilly.com/library/view/python-cookbook/0596001673/ch14s08.html
     import sys
     return sys._getframe(1).f_code.co_name
 
+# normalization ---------------------------------------------------
+
+# CLASSE, AULA and the teacher's names need some "normalization"
+# before use (see below) and every program needs it.  So it is done
+# here, once, by functions that "remember" (lru_cache) the result for
+# each raw value: there are a few hundred distinct values but tens of
+# thousands of rows, so almost every call is a cache hit.
+
+CLASS_CODE = re.compile(r".{0,2}[A-Z]*", re.S)
+
+@lru_cache(maxsize=None)
+def class_codes(classe):
+
+    # See records_to_class_dict below for the meaning of the CLASSE
+    # field; this returns the classes a record "belongs" to:
+    #
+    # "1As"        -> ("1A",)
+    # "[2G/H SPA]" -> ("2G", "2H")
+    #
+    # The section is one letter in the real exports, but the synthetic
+    # ones (see odv-synth.py) have more than 26 sections per year and
+    # go on with "1AAs", "1ABs", ...: so the upper case letters after
+    # the first two characters belong to the class too.
+
+    k = classe.strip().strip("[]")      # Manini 20/01/2021
+    if "/" not in k:
+        return (CLASS_CODE.match(k).group(),)
+    try:
+        cc, mat = k.split()             # ["2G/H". "SPA"]
+    except ValueError:
+        error(f"{_me()}: Bad class record {k}")
+        return ()
+    cc = cc.split("/")                  # ["2G", "H"]
+    return tuple([cc[0]] + [cc[0][0] + c for c in cc[1:]])
+
+# AULA is something like "<Lab. Informatica>Lab. Informatica 1 (2° p
+# 2.04)": the "name" of the room (up to the first parenthesis) and the
+# "code" (what's inside, None if there are no parentheses).
+
+ROOM_PARTS = re.compile(r"(?P<name>[^(]*)(?:\((?P<code>[^()]*))?")
+
+@lru_cache(maxsize=None)
+def room_parts(room):
+    m = ROOM_PARTS.match(room)
+    return m.group("name"), m.group("code")
+
+# When two teachers share a lesson, DOC_COGN and DOC_NOME hold both
+# surnames and both names ("Carli, Valduga" and "Paolo, Gianluca",
+# see clean_prof_cod).  This splits them in (surname, name) pairs.
+
+PROF_SEP = re.compile(r"\s*,\s*")
+
+@lru_cache(maxsize=None)
+def prof_names(surname, name):
+    # ("Carli, Valduga", "Paolo, Gianluca") ->
+    #     (("Carli", "Paolo"), ("Valduga", "Gianluca"))
+    ss = PROF_SEP.split(surname.strip())
+    nn = PROF_SEP.split(name.strip())
+    return tuple(zip(ss, nn, fillvalue=""))
+
 def records_to_class_dict(recs):
 
     # This function get the usual RECS (sequence of Records) and build
     # a dictionary whith the class code as key and a list of records
-    # as value. Each record corresponds to ONE hour of
-    # lesson.
+    # as value. Each record is ONE lesson, that lasts as many hours as
+    # its DURATA: a two hours lesson is NOT copied into two one hour
+    # records any more (the hours are in the occupancy matrices, see
+    # RecordStore.slots and Timetable.classes).
 
     # Each rec in RECS may produce more that on entry in the class's
-    # item for two different reasons.  First, each record has a
-    # DURATION (nomber of hours) and I'll generate one record for each
-    # hour. Second, some recs are "multiclass lines" (as explained
+    # item because some recs are "multiclass lines" (as explained
     # below).
 
     # This function comes from odv-class-timetable.py, that was the
@@ -173,28 +443,14 @@ def records_to_class_dict(recs):
     class_single = defaultdict(list)
     class_multiple = defaultdict(list)
     multi_count = 0
-    recs = tuple(recs)
     for r in recs:
-        k,v = r.CLASSE, r
-        # Manini 20/01/2021
-        k = k.strip().strip("[]")
-
-        if "/" in k:                   # "2G/H SPA"
-            cc, mat = k.split()        # ["2G/H". "SPA"]
-            try:
-                cc = cc.split("/")        # ["2G", "H"]
-                multi_count += 1
-            except:
-                error(f"{_me()}: Bad class record {cc}")
-                continue
-            cc = [cc[0]] + [cc[0][0] + c for c in cc[1:]]
-            # debug(f"Multiclass record {cc}")
+        cc = class_codes(r.CLASSE)
+        if len(cc) > 1:                # "2G/H SPA"
+            multi_count += 1
             for k in cc:
-                # debug(f"Multi {k=} {v=}")
-                class_multiple[k].append(v)
-        else:
-            # debug(f"Single {k=} {v=}")
-            class_single[k[:2]].append(v)
+                class_multiple[k].append(r)
+        elif cc:
+            class_single[cc[0]].append(r)
 
     for k,v in class_multiple.items():
         class_single[k].extend(class_multiple[k])
@@ -202,20 +458,7 @@ def records_to_class_dict(recs):
     debug(f"{_me()}: multiclass recs:{multi_count}")
     debug(f"{_me()}: classes:{len(class_single)}")
 
-    lessons_count = 0
-    for k,v in class_single.items(): # k = class
-        z = v.copy()                 # z = list of lessons (recs)
-        for r in z:                  # r = lesson (rec)
-            d = int(r.DURATA[0])
-            r.ORA_PROG = START_INDEX[r.ORA_INIZIO]
-            lessons_count += 1
-            # if d > 1: debug(f"{_me()}: long lesson {r.CLASSE} -> {d}")
-            for i in range(1, d):
-                t = Record(*list(r))
-                o = START_SHIFT[t.ORA_INIZIO] + i
-                t.ORA_INIZIO = START_TIMES[o]
-                v.append(t)
-
+    lessons_count = sum(len(v) for v in class_single.values())
     classes_count = len(class_single)
 
     debug(f"{_me()}: lessons count:{lessons_count}")
@@ -224,31 +467,700 @@ def records_to_class_dict(recs):
 
     return class_single
 
+def records_to_subject_dict(recs):
+
+    # Subjects are much simpler than classes: the MAT_COD field is used
+    # "as is" as key and each value is the list of records (one per
+    # row, not per hour) teaching that subject.
+
+    subject_dict = defaultdict(list)
+    for r in recs:
+        subject_dict[r.MAT_COD].append(r)
+    debug(f"{_me()}: subjects:{len(subject_dict)}")
+    return subject_dict
+
+# compact records -------------------------------------------------
+
+# The same few strings (days, start times, subjects, teachers,
+# classes, rooms...) are repeated in thousands of rows.  When reading
+# the export all the fields but NUMERO are "interned", so that all the
+# records share a single string object for each value: much less
+# memory, and dict lookups and comparisons between equal strings are
+# resolved by identity.  (The marshal cache stores each interned
+# string only once, too.)
+
+def intern_row(row):
+    return [row[0], *map(sys.intern, row[1:])]
+
+# A RecordStore keeps, as numpy arrays, a small integer code for each
+# record and field (day, start, duration and, when asked for, any
+# other field or tuple of fields) together with the "symbol table" of
+# the distinct values of the field, to decode them.  Whatever depends
+# only on the value of a field (e.g. the classes of a CLASSE, see
+# class_codes) can then be computed once per symbol, not once per
+# record, and spread to the records through the codes.
+
+class RecordStore:
+
+    __slots__ = ("records", "day", "start", "duration", "_codes")
+
+    def __init__(self, records):
+        self.records = records
+        self._codes = dict()
+        self.day = self.symbol_map("GIORNO",
+                                   lambda d: DAYS_INDEX.get(d, FREE))
+        self.start = self.symbol_map("ORA_INIZIO",
+                                     lambda t: START_SHIFT.get(t, FREE))
+        self.duration = self.symbol_map("DURATA",
+                                        lambda d: int(d[0])) # 1h00, 2h00
+
+    def codes(self, field):
+
+        # (codes, symbols): the code of each record and the tuple of
+        # the distinct values (in file order) of FIELD, that can also
+        # be a tuple of names, like ("DOC_COGN", "DOC_NOME").
+
+        if field not in self._codes:
+            get = attrgetter(*field) if isinstance(field, tuple) \
+                else attrgetter(field)
+            symbols = dict()
+            codes = np.fromiter((symbols.setdefault(v, len(symbols))
+                                 for v in map(get, self.records)),
+                                dtype=np.int32, count=len(self.records))
+            self._codes[field] = codes, tuple(symbols)
+            count("symbols", len(symbols))
+        return self._codes[field]
+
+    def symbol_map(self, field, func, dtype=None):
+        # FUNC(value of FIELD) for each record, computed once per symbol
+        codes, symbols = self.codes(field)
+        return np.array([func(s) for s in symbols],
+                        dtype=dtype or np.int32)[codes]
+
+    def column(self, field):
+        # the values of FIELD (shared objects, not copies) as an array
+        codes, symbols = self.codes(field)
+        table = np.empty(len(symbols), dtype=object)
+        table[:] = symbols
+        return table[codes]
+
+    def slots(self):
+        # The lessons as intervals of the week: start slot and duration
+        # (hours) of each record, FREE as start slot for a record with
+        # a bad day or start time.  A two hours lesson is one interval,
+        # never two copies of its record: the occupancy matrices below
+        # are built from these, and so are the spans of MERGE_CELLS
+        # (see Occupancy.spans).
+        ok = (self.day != FREE) & (self.start != FREE)
+        starts = np.where(ok, self.day * LESSONS_PER_DAY + self.start, FREE)
+        return starts.astype(np.int32), self.duration.astype(np.int32)
+
+# occupancy matrices ----------------------------------------------
+
+# The week is a sequence of LESSONS_PER_WEEK "slots" (day by day, hour
+# by hour) and for teachers, classes and rooms what matters is which
+# lessons they have in each slot.  So each of them ("entity") gets a
+# row in an integer matrix (entities x slots) built once, with numpy,
+# from all the records.  Each cell holds FREE or the id of a "group",
+# that is the (sorted) indexes of the records of the lessons the
+# entity has in that slot: usually one, more than one for multiclass
+# lessons (or for errors in the data!).  COUNT holds the size of the
+# groups and MEMBERS/OFFSETS the groups themselves.
+
+FREE = -1
+
+class Occupancy:
+
+    def __init__(self, records, names, grid, count, members, offsets,
+                 starts, sizes):
+        self.records = records
+        self.names = names
+        self.index = list_to_items_pos_dict(names)
+        self.grid = grid
+        self.count = count
+        self.members = members
+        self.offsets = offsets
+        self.starts = starts            # the intervals of the records,
+        self.sizes = sizes              # see RecordStore.slots
+
+    def row(self, name):
+        return self.grid[self.index[name]]
+
+    def group(self, g):
+        if g == FREE:
+            return ()
+        return tuple(self.records[i]
+                     for i in self.members[self.offsets[g]:self.offsets[g+1]])
+
+    def cells(self, name):
+        # list of LESSONS_PER_WEEK tuples of records
+        return [self.group(g) for g in self.row(name)]
+
+    def last(self):
+        # index of the last record (in file order) of each group
+        return self.members[self.offsets[1:] - 1]
+
+    def spans(self):
+
+        # {name: [(first, last), ...]} the slots of the lessons longer
+        # than one hour of each entity, straight from the intervals of
+        # the records (clipped at the end of the day).  A lesson that
+        # is not the one shown (the last record, see occupancy_texts)
+        # in all its slots, because of a clash, is not merged: the
+        # cells of its hours show different things.
+
+        entity, slot, rec = self.triples()
+        start = self.starts[rec]
+        first = (slot == start) & (self.sizes[rec] > 1)
+        end = np.minimum(start + self.sizes[rec] - 1,
+                         start - start % LESSONS_PER_DAY + LESSONS_PER_DAY - 1)
+        shown = np.append(self.last(), FREE)[self.grid]
+        spans = defaultdict(list)
+        for e, a, b, r in zip(entity[first].tolist(), start[first].tolist(),
+                              end[first].tolist(), rec[first].tolist()):
+            if b > a and (shown[e, a:b+1] == r).all():
+                spans[self.names[e]].append((a, b))
+        for ss in spans.values():
+            ss.sort()
+        return spans
+
+    def triples(self):
+
+        # (entity, slot, record) arrays, with one item for each record
+        # of each group in the matrix (see also sqlite_import).
+
+        flat = self.grid.ravel()
+        cells = np.flatnonzero(flat != FREE)
+        cells = cells[np.argsort(flat[cells], kind="stable")] # group order
+        n = np.diff(self.offsets)[flat[cells]]
+        entity, slot = np.divmod(np.repeat(cells, n), LESSONS_PER_WEEK)
+        return entity, slot, self.members
+
+def make_symbol_occupancy(recs, codes, keys, starts, sizes):
+
+    # KEYS has the tuple of entity keys of each symbol (a multiclass
+    # row has more than one class, a record with no room has none) and
+    # CODES the symbol of each record (see RecordStore).  The keys
+    # of the symbols are "spread" to the records, each (record, key)
+    # pair is repeated once for each hour of the lesson and then all
+    # the pairs are "scattered" in the matrix.
+
+    names = sorted({k for kk in keys for k in kk})
+    index = list_to_items_pos_dict(names)
+    lens = np.array([len(kk) for kk in keys], dtype=np.int32)
+    flat = np.array([index[k] for kk in keys for k in kk], dtype=np.int32)
+    n = lens[codes]                     # number of keys of each record
+    first = (np.cumsum(lens) - lens)[codes] # first key of each record
+    rec = np.repeat(np.arange(len(codes), dtype=np.int32), n)
+    pos = np.repeat(first - (np.cumsum(n) - n), n)
+    ent = flat[pos + np.arange(len(rec), dtype=np.int32)]
+
+    size = sizes[rec]
+    first = np.cumsum(size) - size
+    hour = np.arange(size.sum(), dtype=np.int32) - np.repeat(first, size)
+    rec = np.repeat(rec, size)
+    ent = np.repeat(ent, size)
+    start = starts[rec]
+    ok = (start != FREE) & (start % LESSONS_PER_DAY + hour < LESSONS_PER_DAY)
+    cell = (ent * LESSONS_PER_WEEK + start + hour)[ok]
+    rec = rec[ok]
+
+    order = np.lexsort((rec, cell))     # by cell, then in file order
+    cell, rec = cell[order], rec[order]
+    cells, offsets, count = np.unique(cell, return_index=True,
+                                      return_counts=True)
+
+    shape = (len(names), LESSONS_PER_WEEK)
+    grid = np.full(shape[0] * shape[1], FREE, dtype=np.int32)
+    grid[cells] = np.arange(len(cells), dtype=np.int32)
+    counts = np.zeros(shape[0] * shape[1], dtype=np.int32)
+    counts[cells] = count
+    offsets = np.append(offsets, len(rec)).astype(np.int32)
+    return Occupancy(recs, names, grid.reshape(shape),
+                     counts.reshape(shape), rec, offsets, starts, sizes)
+
+def occupancy_texts(occ, texts):
+
+    # Matrix (same shape as OCC.grid) of the TEXTS (one per record) of
+    # the last record of each group, empty strings for FREE slots.
+
+    texts = np.array(list(texts) + [""], dtype=object)
+    last = np.append(occ.last(), len(texts) - 1) # last[FREE] -> ""
+    return texts[last[occ.grid]]
+
+# clashes ---------------------------------------------------------
+
+# Nothing in the export prevents a teacher (or a class, or a room) to
+# have two lessons at the same time: when building the full timetable
+# the last one just "won" and nobody noticed.  The occupancy matrices
+# already group together all the lessons of each entity in each slot,
+# so the double bookings are just the cells whose COUNT is greater
+# than one.  For classes, lessons of multiclass records (groups of
+# students from different classes, see records_to_class_dict) do
+# share slots by design, so only groups with at least one "whole
+# class" lesson are clashes.  Loading an export does not look for
+# them (a program that only needs the classes never builds the
+# teachers): odv-clashes.py prints them and odv-batch.publish writes
+# clashes.txt in its output directory.
+
+Clash = namedtuple("Clash", "kind name slot numbers")
+
+def slot_name(slot):
+    d, h = divmod(int(slot), LESSONS_PER_DAY)
+    return f"{list(DAYS_SHIFT)[d]} {START_TIMES[h]}"
+
+def occupancy_clashes(kind, occ, shared=None):
+
+    # SHARED is an optional boolean array with one item per record:
+    # the records that are allowed to share a slot with each other.
+
+    clash = occ.count > 1
+    if not clash.any():
+        return []
+    if shared is not None:
+        strict = np.add.reduceat((~shared)[occ.members], occ.offsets[:-1])
+        clash[clash] = strict[occ.grid[clash]] > 0
+    ee, ss = np.nonzero(clash)
+    return [Clash(kind, occ.names[e], int(s),
+                  tuple(r.NUMERO for r in occ.group(occ.grid[e, s])))
+            for e, s in zip(ee, ss)]
+
+def find_clashes(tt):
+    codes, keys = tt.class_symbols
+    multi = np.array([len(cc) > 1 for cc in keys], dtype=bool)[codes]
+    clashes = (occupancy_clashes("teacher", tt.teachers) +
+               occupancy_clashes("class", tt.classes, multi) +
+               occupancy_clashes("room", tt.rooms))
+    debug(f"{_me()}: {len(clashes)} clashes found")
+    count("clashes", len(clashes))
+    return clashes
+
+def entity_name(name):
+    # ("Manini", "Luca") -> "Manini, Luca", "2G" -> "2G"
+    return ", ".join(name) if isinstance(name, tuple) else name
+
+def format_clash(c):
+    name = entity_name(c.name)
+    return f"{c.kind:8s} {slot_name(c.slot):15s} {name} = {' '.join(c.numbers)}"
+
+def write_clashes(clashes, out_file="out/clashes.txt"):
+    if clashes:
+        error(f"{len(clashes)} clashes found, see '{out_file}'")
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    with stage("write"), open(out_file, "w") as out:
+        for c in clashes:
+            out.write(format_clash(c) + "\n")
+
+# availability ----------------------------------------------------
+
+# Who is free on Tuesday at the third hour?  Which labs are free on
+# Friday for two hours?  Each teacher, class and room gets a bitmask
+# of the week (bit N set = busy in slot N, day by day and hour by hour) made from
+# its row of the occupancy matrix, so that each question is a few
+# binary "and" and "or", on all of them at once (numpy uint64 arrays,
+# 54 slots fit in 64 bits).
+
+WEEK_MASK = (1 << LESSONS_PER_WEEK) - 1
+
+def slot_mask(first, hours=1):
+    # the bits of HOURS consecutive slots from FIRST on
+    return ((1 << hours) - 1) << first
+
+def free_runs(busy, hours=1):
+
+    # [(first, length), ...] the runs of at least HOURS consecutive
+    # free slots (in the same day) of the BUSY mask.
+
+    runs = list()
+    for day in range(DAYS_PER_WEEK):
+        first = None
+        for h in range(LESSONS_PER_DAY + 1):
+            slot = day * LESSONS_PER_DAY + h
+            free = h < LESSONS_PER_DAY and not busy >> slot & 1
+            if free and first is None:
+                first = slot
+            elif not free and first is not None:
+                if slot - first >= hours:
+                    runs.append((first, slot - first))
+                first = None
+    return runs
+
+class Availability:
+
+    def __init__(self, names, masks):
+        self.names = names
+        self.index = list_to_items_pos_dict(names)
+        self.masks = masks
+
+    @classmethod
+    def from_occupancy(cls, occ):
+        bits = np.uint64(1) << np.arange(LESSONS_PER_WEEK, dtype=np.uint64)
+        busy = np.where(occ.grid != FREE, bits, np.uint64(0))
+        return cls(occ.names, np.bitwise_or.reduce(busy, axis=1))
+
+    def busy(self, *names):
+        # the slots where at least one of NAMES is busy
+        mask = 0
+        for name in names:
+            mask |= int(self.masks[self.index[name]])
+        return mask
+
+    def free(self, mask):
+        # the names free in all the slots of MASK
+        ok = (self.masks & np.uint64(mask)) == 0
+        return [self.names[i] for i in np.flatnonzero(ok)]
+
+    def free_for(self, first, hours=1):
+        # the names free for HOURS consecutive slots from FIRST on
+        if first % LESSONS_PER_DAY + hours > LESSONS_PER_DAY:
+            raise ValueError(f"{hours} hours from {slot_name(first)} "
+                             f"go past the end of the day")
+        return self.free(slot_mask(first, hours))
+
+    def common_free(self, names, hours=1):
+        # [(first, length), ...] when all NAMES are free together
+        return free_runs(self.busy(*names), hours)
+
+# workload --------------------------------------------------------
+
+# How heavy is the week of each teacher (and class)?  Hours per day,
+# first and last hour, the "buchi" (free hours between the first and
+# the last lesson of a day) and the longest run of consecutive hours.  The
+# occupancy matrix, seen as an (entities x days x hours) boolean
+# array, gives all of them for everybody with a few numpy reductions:
+# no loop on teachers, days or hours.  FIRST and LAST are hour indexes
+# (FREE on a day with no lessons), LONGEST the longest run of a day.
+
+class Workload:
+
+    def __init__(self, names, busy):
+        self.names = names
+        self.busy = busy
+        hours = LESSONS_PER_DAY
+        some = busy.any(axis=2)
+        first = busy.argmax(axis=2)
+        last = hours - 1 - busy[:, :, ::-1].argmax(axis=2)
+        self.hours = busy.sum(axis=2)
+        self.first = np.where(some, first, FREE)
+        self.last = np.where(some, last, FREE)
+        self.gaps = np.where(some, last - first + 1 - self.hours, 0)
+
+        # The length of the run of consecutive hours up to each hour is
+        # the count of busy hours so far minus the count at the last
+        # free hour.
+
+        n = busy.cumsum(axis=2)
+        n -= np.maximum.accumulate(np.where(busy, 0, n), axis=2)
+        self.longest = n.max(axis=2, initial=0)
+
+    @classmethod
+    def from_occupancy(cls, occ):
+        busy = (occ.grid != FREE).reshape(len(occ.names), DAYS_PER_WEEK,
+                                          LESSONS_PER_DAY)
+        return cls(occ.names, busy)
+
+    def week(self):
+        # (entities x 4) hours, gaps, days with lessons, longest run
+        return np.stack([self.hours.sum(axis=1), self.gaps.sum(axis=1),
+                         (self.hours > 0).sum(axis=1),
+                         self.longest.max(axis=1, initial=0)], axis=1)
+
+WORKLOAD_WEEK = ("Ore", "Buchi", "Giorni", "Fila")
+WORKLOAD_DAY = ("Ore", "Buchi", "Prima", "Ultima", "Fila")
+
+def workload_rows(wl):
+
+    # A row for each entity: the name, the WORKLOAD_WEEK numbers and
+    # then the WORKLOAD_DAY numbers of each day (hours counted from 1,
+    # None on days with no lessons).
+
+    days = np.stack([wl.hours, wl.gaps, wl.first + 1, wl.last + 1,
+                     wl.longest], axis=2)
+    days = np.where((wl.hours > 0)[:, :, None], days, FREE)
+    days = days.reshape(len(wl.names),
+                        DAYS_PER_WEEK * len(WORKLOAD_DAY)).tolist()
+    return [[entity_name(name), *week,
+             *[None if v == FREE else v for v in dd]]
+            for name, week, dd in zip(wl.names, wl.week().tolist(), days)]
+
+def write_workload_sheet(sheet, fmt, title, rows):
+    sheet.set_column(0, 0, 25, fmt["prof"])
+    sheet.set_column(1, len(WORKLOAD_WEEK) +
+                     DAYS_PER_WEEK * len(WORKLOAD_DAY), 6, fmt["cell"])
+    sheet.write(0, 0, title, fmt["header"])
+    col = 1
+    for label, n in [("Settimana", len(WORKLOAD_WEEK))] + \
+        [(d.capitalize(), len(WORKLOAD_DAY)) for d in DAYS_SHIFT]:
+        sheet.merge_range(0, col, 0, col + n - 1, label, fmt["days"])
+        col += n
+    sheet.write_row(1, 1, WORKLOAD_WEEK + WORKLOAD_DAY * DAYS_PER_WEEK,
+                    fmt["hours"])
+    for row, data in enumerate(rows, 2):
+        sheet.write_row(row, 0, data)
+
+# parallel rendering ----------------------------------------------
+
+# The timetable of each class (or teacher) can be rendered without
+# looking at the others, so the work can be fanned out to a pool of
+# processes (--jobs option of the programs).  Results come back in the
+# same order of the items, so the outputs never depend on the number
+# of jobs.  JOBS = 0 means one job per CPU core.
+
+def parallel_map(func, items, jobs=1):
+    items = list(items)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(items) < 2:
+        return [func(o) for o in items]
+    from concurrent.futures import ProcessPoolExecutor
+    chunksize = max(1, len(items) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(func, items, chunksize=chunksize))
+
+# Command line options shared by the programs, like "--jobs 4" (or
+# "--jobs=4"), are taken out of ARGS before looking at the arguments.
+
+def pop_option(args, name, default=None):
+    for i, a in enumerate(args):
+        if a == name and i + 1 < len(args):
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        if a.startswith(name + "="):
+            del args[i]
+            return a[len(name) + 1:]
+    return default
+
+# profiling -------------------------------------------------------
+
+# The debug lines tell what has been done, not how long it took.  With
+# PROFILE set (--profile option of the programs) the main stages of
+# the processing (read, decode, parse, expand, aggregate, check,
+# render, write) are timed and some counters (rows, lessons,
+# multiclass rows, bad codes, ...) are kept; at exit a report is
+# logged and written, as JSON, in PROFILE_FILE.  Stages can nest (e.g.
+# "parse" includes "decode"), so their times are inclusive.  With
+# CPROFILE also set (--cprofile) the CPROFILE_STAGES are run under
+# cProfile and their CPROFILE_TOP functions go in the report too.
+
+PROFILE = False
+PROFILE_FILE = "out/profile.json"
+CPROFILE = False
+CPROFILE_STAGES = ("parse", "aggregate", "render")
+CPROFILE_TOP = 20
+
+STAGES = ordereddict()                  # name -> [calls, seconds]
+COUNTERS = ordereddict()                # name -> count
+PROFILERS = dict()                      # name -> cProfile.Profile
+_profiling = None                       # the active profiler, if any
+_profile_start = time.perf_counter()
+
+def _stage_start(name):
+    global _profiling
+    STAGES.setdefault(name, [0, 0.0])   # report in starting order
+    if CPROFILE and name in CPROFILE_STAGES and _profiling is None:
+        import cProfile
+        _profiling = PROFILERS.setdefault(name, cProfile.Profile())
+        _profiling.enable()
+        return time.perf_counter(), _profiling
+    return time.perf_counter(), None
+
+def _stage_stop(name, token, calls=1):
+    global _profiling
+    start, prof = token
+    if prof is not None:
+        prof.disable()
+        _profiling = None
+    s = STAGES.setdefault(name, [0, 0.0])
+    s[0] += calls
+    s[1] += time.perf_counter() - start
+
+@contextmanager
+def stage(name):
+    if not PROFILE:
+        yield
+        return
+    token = _stage_start(name)
+    try:
+        yield
+    finally:
+        _stage_stop(name, token)
+
+# For generators a "with stage(...)" would time the consumer too, so
+# here only the time spent producing the ITEMS is taken.
+
+def staged(name, items):
+    return _staged(name, iter(items)) if PROFILE else items
+
+def _staged(name, items):
+    calls = 1
+    while True:
+        token = _stage_start(name)
+        try:
+            o = next(items)
+        except StopIteration:
+            _stage_stop(name, token, calls)
+            return
+        _stage_stop(name, token, calls)
+        calls = 0
+        yield o
+
+def count(name, n=1):
+    if PROFILE:
+        COUNTERS[name] = COUNTERS.get(name, 0) + n
+
+def profile_report():
+    report = {"program": os.path.basename(sys.argv[0]),
+              "total": round(time.perf_counter() - _profile_start, 4),
+              "stages": {k: {"calls": c, "seconds": round(t, 4)}
+                         for k, (c, t) in STAGES.items()},
+              "counters": dict(COUNTERS)}
+    if PROFILERS:
+        import pstats
+        report["cprofile"] = dict()
+        for name, prof in PROFILERS.items():
+            stats = pstats.Stats(prof).sort_stats("cumulative")
+            top = list()
+            for f in stats.fcn_list[:CPROFILE_TOP]:
+                cc, nc, tt, ct, _ = stats.stats[f]
+                top.append({"function": pstats.func_std_string(f),
+                            "calls": nc, "tottime": round(tt, 4),
+                            "cumtime": round(ct, 4)})
+            report["cprofile"][name] = top
+    return report
+
+def write_profile(out_file=None):
+    out_file = out_file or PROFILE_FILE
+    report = profile_report()
+    for k, v in report["stages"].items():
+        info(f"profile: {k:10s} {v['seconds']:9.4f}s {v['calls']:6d} calls")
+    for k, v in report["counters"].items():
+        info(f"profile: {k:20s} {v:9d}")
+    os.makedirs(os.path.dirname(out_file) or ".", exist_ok=True)
+    with open(out_file, "w") as out:
+        json.dump(report, out, indent=1)
+    info(f"profile: report written to '{out_file}'")
+    return report
+
+# "--profile" and "--cprofile" are taken out of ARGS (as pop_option
+# does) and turn profiling on; the report is written at exit.
+
+def pop_profile(args):
+    global PROFILE, CPROFILE
+    if "--cprofile" in args:
+        args.remove("--cprofile")
+        PROFILE = CPROFILE = True
+    if "--profile" in args:
+        args.remove("--profile")
+        PROFILE = True
+    if PROFILE:
+        logging.getLogger().setLevel(logging.INFO) # no DEBUG spam
+        atexit.register(write_profile)
+    return PROFILE
+
+# output manifest -------------------------------------------------
+
+# A small change in EDT usually touches a handful of classes and
+# teachers, but all the outputs were rendered and written again (and
+# then pushed to the web server...).  The manifest (a JSON file)
+# records, for each generated file, a hash of the inputs it was
+# generated from: if the hash did not change and the file is still
+# there, the writers skip it altogether.  Files holding many entities
+# (e.g. the full timetable workbook) also record the hash of each
+# entity, so that the report can tell which ones changed.
+# OUTPUT_VERSION must be increased when the renderers change.
+
+MANIFEST_FILE = "out/manifest.json"
+OUTPUT_VERSION = 2                      # 2: workload sheets
+
+def inputs_hash(*parts):
+    h = hashlib.sha1(f"{OUTPUT_VERSION}".encode())
+    for p in parts:
+        h.update(repr(p).encode())
+    return h.hexdigest()
+
+class Manifest:
+
+    def __init__(self, path=None):
+        self.path = path = path or MANIFEST_FILE
+        try:
+            with open(path) as data:
+                self.hashes = json.load(data)
+        except (OSError, ValueError):
+            self.hashes = dict()
+        self.regenerated = list()
+        self.skipped = list()
+
+    def stale(self, artifact, key):
+        if self.hashes.get(artifact) == key and os.path.exists(artifact):
+            self.skipped.append(artifact)
+            return False
+        return True
+
+    def changed(self, artifact, keys):
+        # KEYS = {entity: hash}, returns the entities whose hash changed
+        return [k for k, v in keys.items()
+                if self.hashes.get(f"{artifact}#{entity_name(k)}") != v]
+
+    def update(self, artifact, key, keys=None):
+        if keys is not None:
+            changed = self.changed(artifact, keys)
+            info(f"'{artifact}': {len(changed)} of {len(keys)} changed")
+            prefix = f"{artifact}#"
+            for k in [k for k in self.hashes if k.startswith(prefix)]:
+                del self.hashes[k]
+            for k, v in keys.items():
+                self.hashes[prefix + entity_name(k)] = v
+        self.hashes[artifact] = key
+        self.regenerated.append(artifact)
+
+    def prune(self, directory, artifacts):
+        # removes the files in DIRECTORY written in a previous run that
+        # are not among ARTIFACTS any more (a class that is gone, ...)
+        prefix = os.path.join(directory, "")
+        keep = set(artifacts)
+        for f in [f for f in self.hashes
+                  if f.startswith(prefix) and "#" not in f and f not in keep]:
+            del self.hashes[f]
+            if os.path.exists(f):
+                os.remove(f)
+                info(f"removed stale '{f}'")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as out:
+            json.dump(self.hashes, out, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        for artifact in self.regenerated:
+            debug(f"regenerated '{artifact}'")
+        info(f"{len(self.regenerated)} files regenerated, "
+             f"{len(self.skipped)} unchanged")
+        count("files_regenerated", len(self.regenerated))
+        count("files_unchanged", len(self.skipped))
+
 # code specific to full-timetable (tabellone) --------------------
 
-def make_lessons_list():
-    return [""] * LESSONS_PER_WEEK
+PROF_PAIRS = "data/prof_pairs.txt"
 
-def format_room(room):
+# The pairs dictionary also keeps (in RESOLVED) the result of
+# clean_prof_cod for each code already seen, see below.
 
-    # Nel file di export, il dato AULA è piuttosto logorroico,
-    # qualcosa del tipo "Aula 3Hsa (2.50)" (quando va bene), me nel
-    # tabellone voglio qualcosa di più sintetico, ad esempio solo la
-    # classe.
+class ProfPairs(dict):
 
-    if "(" in room:
-        room = room.split("(")[1]
-    if ")" in room:
-        room = room.split(")")[0]
-    room = room.replace("<Aule per gruppi>Aula Magna 4° piano", "A.M.")
-    return room
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.resolved = dict()
 
-def load_prof_pairs_dic():
-    pp = dict()
-    file = open("data/prof_pairs.txt")
-    if not file:
+def load_prof_pairs_dic(input=None):
+    pp = ProfPairs()
+    try:
+        file = open(input or PROF_PAIRS)
+    except FileNotFoundError:
         return pp
     for r in file:
+        if not r.strip():
+            continue
         ss, choice = r.split("=")
         first, second = map(str.strip, ss.split(","))
         choice = choice.strip()
@@ -257,6 +1169,18 @@ def load_prof_pairs_dic():
     return pp
 
 def clean_prof_cod(prof_cod, prof_pairs_dic):
+
+    # The same few hundred codes come again and again: if the pairs
+    # come from load_prof_pairs_dic, each one is resolved only once.
+
+    resolved = getattr(prof_pairs_dic, "resolved", None)
+    if resolved is None:
+        return resolve_prof_cod(prof_cod, prof_pairs_dic)
+    if prof_cod not in resolved:
+        resolved[prof_cod] = resolve_prof_cod(prof_cod, prof_pairs_dic)
+    return resolved[prof_cod]
+
+def resolve_prof_cod(prof_cod, prof_pairs_dic):
     # prof_cod = ('Carli, Valduga', 'Paolo, Gianluca')
     first, second = prof_cod
     # first = 'Carli, Valduga'
@@ -267,147 +1191,210 @@ def clean_prof_cod(prof_cod, prof_pairs_dic):
         return prof_cod
     if "," not in first or "," not in second:
         raise Exception(f"clean_prof_cod: BAD CODE '{prof_cod}' '{first}' '{second}'")
-    s0, s1 = map(str.strip, first.split(","))
-    n0, n1 = map(str.strip, second.split(","))
-    alias = prof_pairs_dic[(s0,s1)]
+    (s0, n0), (s1, n1) = prof_names(first, second)
+    alias = prof_pairs_dic.get((s0,s1))
+    if alias is None:
+
+        # Una coppia che manca in PROF_PAIRS (o un file che non c'è
+        # proprio): si segnala e il "docente" resta la coppia, come
+        # nell'export, invece di fermare tutto.
+
+        error(f"clean_prof_cod: no pair '{s0}, {s1}' in the prof pairs")
+        count("unresolved_pairs")
+        return prof_cod
     new_prof_cod = (s0, n0) if alias == s0 else (s1,n1)
     debug(f"clean_prof_cod: {prof_cod} to {new_prof_cod}")
     return new_prof_cod
 
 def data_to_prof_dict(raw_data):
+    return load_timetable(raw_data).prof_dict
 
-    # Questo è il dizionario che, per ciascun prof usato come chiave,
-    # contiene le relative ore di lezione.  Uso defaultdict così "al
-    # primo giro" ho già una lista di stringhe vuote (generata da
-    # make_lessons_list) della lunghezza corretta.
+def prof_cell(o):
 
-    prof_dict = defaultdict(make_lessons_list)
-    enc = get_encoding(raw_data)
-    prof_pairs_dic = load_prof_pairs_dic()
+    # Qui scelto cosa scrivere nelle celle del foglio: la classe.
 
-    debug(f"Reading raw data file '{raw_data}', encoding with {enc}")
-    with open(raw_data, newline="", encoding=enc) as data:
-        rows = list(csv.reader(data, delimiter=";"))[1:]
-        for r in rows:
+    return o.CLASSE
 
-            # Qui creo, a partire dalla "riga" letta da CSV, una
-            # struttura i cui (nomi degli) attributi sono definiti
-            # dalla classe Record e che ho lasciato uguali a quelli
-            # presenti nel file CSV.
-
-            o = make_record(r)
-            # o = Record(*r)
-
-            # I dati delle varie righe vengono raccolti in un
-            # dizionario in cui le chiavi sono i dati del docente, ad
-            # esempio la coppia cognome/nome.
-
-            # Manini: 19 marzo 2021 (sic!)
-            # -------------------------------------------------------------
-            # Ogni tanto al posto di un nome di docente ce ne sono
-            # due, come si può vedere da questi messaggi di debug
-            # (precedenti al fix!). In quel caso, al posto del cognome
-            # ci sono i due cognomi (che geni!) e al posto dei nomi i
-            # due nomi (almeno coerenti!).
-            # -------------------------------------------------------------
-            # DEBUG: prof_cod = ('Gruber', 'Evelin')
-            # DEBUG: prof_cod = ('Gruber, Valduga', 'Evelin, Gianluca')
-            # DEBUG: prof_cod = ('Gubert', 'Chiara')
-            # DEBUG: prof_cod = ('Gubert, Nanut', 'Chiara, Michela')
-            # -------------------------------------------------------------
-            # La funzione clean_prof_cod si occupa di mettere tutto a posto!
-
-            prof_cod = o.DOC_COGN, o.DOC_NOME
-            prof_cod = clean_prof_cod(prof_cod, prof_pairs_dic)
-            # debug(f"{prof_cod = }")
-
-            # Dati sulla classe
-
-            room = format_room(o.AULA)
-
-            # Qui scelto cosa scrivere nelle celle del foglio. Posso
-            # mettere sola la classe, solo l'aula o quello che voglio.
-            # Qui ci sono alcuni esempi da (s)commentare.
-
-            # cell = room + " / " + o.CLASSE
-            cell = o.CLASSE
-            # cell = room
-
-            # Qui gestisco le ore "multiple" (consecutive). Nel file
-            # CSV, per ogni lezione c'è una sola riga, in cui si
-            # indica però anche la durata.  Quello che faccio qui è
-            # "duplicare il dato" per ciascuna ora di lezione,
-            # perdendo così il dato esplicito della durata.  Poi nella
-            # generazione dell'XLS mi preoccupa di fare il merge delle
-            # varie celle.
-
-            size = int(o.DURATA[0]) # 1h00, 2h00 etc
-            for i in range(size):
-                day_cod = (DAYS_SHIFT[o.GIORNO] +
-                           START_SHIFT[o.ORA_INIZIO] +
-                           i)
-                # if o.ORA_INIZIO == "13h10":
-                #     print(f"{day_cod=} {o.GIORNO=}")
-                prof_dict[prof_cod][day_cod] = cell
-
-    if CHECK_RECORDS:
-        pp = {str(p[0]) for p in prof_dict}
-        pp = [p for p in sorted(pp) if "," in p]
-        with open("out/profs_log.txt", "w") as out:
-                out.write("\n".join(pp))
-
-    return prof_dict
-
-def write_prof_dict_xls(prof_dict, xsl_out):
+def occupancy_to_prof_dict(occ):
 
-    # Nel dubbio, consultare:
-    # https://xlsxwriter.readthedocs.io/examples.html
-    # https://xlsxwriter.readthedocs.io/format.html#format
+    # Questo è il dizionario che, per ciascun prof usato come chiave,
+    # contiene le relative ore di lezione: una lista (una voce per
+    # ogni ora della settimana, LESSONS_PER_WEEK) con il testo delle
+    # celle, ricavata direttamente dalla matrice dei docenti.
+    # Se un docente ha due lezioni nella stessa ora vince l'ultima
+    # riga del file (come è sempre stato).
+
+    texts = occupancy_texts(occ, [prof_cell(o) for o in occ.records])
+    return dict(zip(occ.names, texts.tolist()))
+
+def prof_row(item):
+
+    # Il testo delle celle della riga di un prof: prima i suoi dati
+    # (cognome e iniziale del nome) e poi le sue ore di lezione.
+
+    prof_cod, ss = item
+    prof_surname, prof_firstname = prof_cod
+    prof_data = "%s %s." % (prof_surname, prof_firstname and
+                                prof_firstname[0])
+    return [clean_cell(text) for text in [prof_data] + ss]
+
+def clean_cell(text):
+
+    # Manini: 04/02/2021
+    text = text.strip().strip("[]")
+
+    # Manini: strip MATTER ???
+
+    if DELETE_MATTER and " " in text:
+        text = text.split()[0]
+
+    return text
+
+def row_spans(data, start, offset, spans=None):
+
+    # [(first_col, last_col, text), ...] for the cells of DATA from
+    # column START on; lessons start at column OFFSET.  If SPANS (the
+    # (first, last) slots of the lessons longer than one hour, see
+    # Occupancy.spans) are known, the cells of each lesson are
+    # grouped, otherwise consecutive cells with the same (non empty)
+    # text in the same day.
+
+    if spans is not None:
+        ends = {offset + first: offset + last for first, last in spans}
+        spans = list()
+        col = start
+        while col < len(data):
+            last = ends.get(col, col)
+            spans.append([col, last, data[col]])
+            col = last + 1
+        return spans
+
+    spans = list()
+    for col in range(start, len(data)):
+        text = data[col]
+        if (spans and text and spans[-1][2] == text and
+            (col - offset) % LESSONS_PER_DAY != 0):
+            spans[-1][1] = col
+        else:
+            spans.append([col, col, text])
+    return spans
 
-    debug(f"Writing output XLS file '{xsl_out}'")
-    book = xlsxwriter.Workbook(xsl_out)
+def prof_dict_rows(prof_dict, jobs=1):
+    return parallel_map(prof_row, sorted(prof_dict.items()), jobs)
 
-    # Qui posso definire vari formati che poi utilizzo nelle chiamate
-    # a merge_range e a write (credo). Hanno un aspetto molto CSS, ma
-    # non so se la corrispondenza è completa.
+# Qui posso definire vari formati che poi utilizzo nelle chiamate a
+# merge_range e a write (credo). Hanno un aspetto molto CSS, ma non so
+# se la corrispondenza è completa.  I formati vengono aggiunti una
+# volta sola per workbook (make_formats) e poi usati da tutti i fogli.
 
-    title_format = book.add_format({
+XLS_FORMATS = {
+    "title": {
         'align': 'center',
         'bold': True,
         'font_size': 20,
-        })
-    days_format = book.add_format({
+        },
+    "days": {
         'align': 'center',
         'bold': True,
-        })
-    hours_format = book.add_format({
+        },
+    "hours": {
         'align': 'center',
         'bold': True,
-        })
-    merge_format = book.add_format({
+        },
+    "merge": {
         'align': 'center',
-    })
-    cell_format = book.add_format({
+        },
+    "cell": {
         'align': 'center',
-    })
-    prof_format = book.add_format({
+        },
+    "prof": {
         'align': 'left',
-    })
+        },
+    "wrap": {
+        'text_wrap': True,
+        'align': 'center',
+        'valign': 'vcenter',
+        },
+    "header": {
+        'bold': True,
+        },
+}
+
+def make_formats(book):
+    return {k: book.add_format(v) for k, v in XLS_FORMATS.items()}
+
+def prof_dict_hashes(prof_dict):
+    return {k: inputs_hash(k, v) for k, v in prof_dict.items()}
+
+def write_prof_dict_xls(prof_dict, xsl_out, manifest=None, jobs=1,
+                        spans=None):
+
+    # Nel dubbio, consultare:
+    # https://xlsxwriter.readthedocs.io/examples.html
+    # https://xlsxwriter.readthedocs.io/format.html#format
+
+    # SPANS (se c'è) sono le lezioni lunghe di ciascun prof (vedi
+    # Occupancy.spans), per unire le loro celle quando MERGE_CELLS.
+
+    if not MERGE_CELLS:
+        spans = None
+
+    # Se c'è un MANIFEST (vedi sopra) e i dati non sono cambiati
+    # dall'ultima volta, non c'è niente da fare.
+
+    if manifest is not None:
+        keys = prof_dict_hashes(prof_dict)
+        key = inputs_hash(sorted(keys.items()), DELETE_MATTER, MERGE_CELLS)
+        if spans is not None:
+            key = inputs_hash(key, sorted(spans.items()))
+        if not manifest.stale(xsl_out, key):
+            debug(f"Output XLS file '{xsl_out}' is up to date")
+            return
+        manifest.update(xsl_out, key, keys)
+
+    # Il workbook è in modalità "constant_memory": xlsxwriter tiene in
+    # memoria solo la riga corrente e la scrive su file appena si
+    # passa alla successiva, quindi le righe vanno scritte in ordine
+    # (e tutte le celle di una riga insieme).  Così memoria e tempo
+    # non crescono con il numero dei prof.
+
+    debug(f"Writing output XLS file '{xsl_out}'")
+    with stage("render"):
+        rows = prof_dict_rows(prof_dict, jobs)
+    with stage("write"):
+        book = xlsxwriter.Workbook(xsl_out, {"constant_memory": True})
+        fmt = make_formats(book)
+        write_grid_sheet(book.add_worksheet(), fmt, "Orario", rows,
+                         grid_spans(spans, sorted(prof_dict)))
+        book.close()
+
+def grid_spans(spans, names):
+    # the spans (see Occupancy.spans) of the rows of NAMES, or None
+    if spans is None:
+        return None
+    return [spans.get(k, ()) for k in names]
+
+def write_grid_sheet(sheet, fmt, title, rows, spans=None):
+
+    # Un foglio "tabellone": una riga per ciascun prof (o aula...) e
+    # una colonna per ciascuna ora della settimana.  ROWS contiene il
+    # testo (già "pulito") delle celle di ciascuna riga e SPANS (se
+    # c'è) le lezioni lunghe di ciascuna riga (vedi Occupancy.spans).
 
-    sheet = book.add_worksheet()
     sheet.set_default_row(20)
-    sheet.set_column(0, 0, 25, prof_format)
-    # sheet.set_column(1, 1, 25, prof_format)
+    sheet.set_column(0, 0, 25, fmt["prof"])
+    # sheet.set_column(1, 1, 25, fmt["prof"])
 
     # Scrittura della parte "fissa" di headers
     row = 0
     prof_off = 1         # numero di colonne usate per i dati del prof
     if True:
 
-        # Titolo: centrato su tutta la larghezza (48 colonne)
+        # Titolo: centrato su tutta la larghezza
 
         sheet.set_row(row, 42)
-        sheet.merge_range(0,0,0,48, "Orario", title_format)
+        sheet.merge_range(0, 0, 0, prof_off + LESSONS_PER_WEEK - 1,
+                          title, fmt["title"])
         row += 1
 
         # Giorni della settimana, presi da DAYS_SHIFT
@@ -419,60 +1406,132 @@ def write_prof_dict_xls(prof_dict, xsl_out):
             range_end   = range_start + LESSONS_PER_DAY - 1
             sheet.merge_range(row, range_start,
                               row, range_end,
-                              day, days_format)
+                              day, fmt["days"])
         row += 1
 
         # Ore del giorno, prese da START_SHIFT, in cui hanno un
         # formato tipo 07h30 che converto in 7:30.
 
         sheet.set_row(row, 20)
-        for d in range(DAYS_PER_WEEK):
-            for i, hour in enumerate(START_SHIFT.keys()):
-                if hour[0] == "0":
-                    hour = hour[1:]
-                hour = hour.replace("h", ":")
-                sheet.write(row, prof_off + i + d * LESSONS_PER_DAY, # ???
-                            hour, hours_format)
+        hours = list()
+        for hour in START_SHIFT.keys():
+            if hour[0] == "0":
+                hour = hour[1:]
+            hours.append(hour.replace("h", ":"))
+        sheet.write_row(row, prof_off, hours * DAYS_PER_WEEK, fmt["hours"])
         row += 1
 
-    # Scrittura delle righe relative alle ore di lezione. Tutto facile
-    # a parte raggruppare le "doppiette" o le "triplette". Per fare
-    # questo uso un "trucco", se una cella ha lo stesso contenuto
-    # della precedente faccio un merge; fortunatamente pare funzionare
-    # anche "ricorsivamente", per esempio facendo il merge di una
-    # terza ora con le precedenti due già raggruppate.
+    # Scrittura delle righe relative alle ore di lezione, una riga
+    # alla volta con write_row; il testo delle celle è già stato
+    # "pulito" da prof_row.  Se richiesto, le "doppiette" o le
+    # "triplette" (le ore della stessa lezione o, se non si sa, celle
+    # consecutive con lo stesso contenuto, vedi row_spans) diventano
+    # un'unica cella con merge_range.
 
     row_off = row
-    for row, (prof_cod, ss) in enumerate(sorted(prof_dict.items())):
+    for row, data in enumerate(rows):
         row += row_off
-        prof_surname, prof_firstname = prof_cod
-        prof_data = "%s %s." % (prof_surname, prof_firstname and
-                                    prof_firstname[0])
-        data = [prof_data] + ss
-        old = None
-        for col, text in enumerate(data):
+        sheet.write_row(row, 0, data[:2], fmt["prof"])
+        if not MERGE_CELLS:
+            sheet.write_row(row, 2, data[2:], fmt["cell"])
+            continue
+        ss = spans[row - row_off] if spans is not None else None
+        for first, last, text in row_spans(data, 2, prof_off, ss):
+            if first == last:
+                sheet.write(row, first, text, fmt["cell"])
+            else:
+                sheet.merge_range(row, first, row, last, text, fmt["merge"])
 
-            # Manini: 04/02/2021
-            text = text.strip().strip("[]")
+# rooms and subjects sheets ------------------------------------------
 
-            # Manini: strip MATTER ???
+# The rooms sheet is a "full timetable" with one row per room, showing
+# which class is there in each hour; the subjects sheet is a summary
+# with the weekly hours, the teachers and the classes of each subject.
 
-            if DELETE_MATTER and " " in text:
-                text = text.split()[0]
+def room_rows(rooms):
+    texts = occupancy_texts(rooms, [r.CLASSE for r in rooms.records])
+    return [[room] + [clean_cell(t) for t in ss]
+            for room, ss in zip(rooms.names, texts.tolist())]
 
-            if col in [0,1]:
-                sheet.write(row, col, text, prof_format)
-            else:
-                if MERGE_CELLS and text and text == old:
-                    sheet.merge_range(row, col-1,
-                                      row, col,
-                                      text, merge_format)
-                    old = None
-                else:
-                    sheet.write(row, col, text, cell_format)
-                    old = text
+def room_hashes(rooms):
+    return {k: inputs_hash(k, [[tuple(r) for r in oo] for oo in rooms.cells(k)])
+            for k in rooms.names}
 
-    book.close()
+def subject_rows(subject_dict):
+    mat_names = get_mat_names()
+    rows = list()
+    for mat, rr in sorted(subject_dict.items()):
+        hours = sum(int(r.DURATA[0]) for r in rr)
+        profs = sorted({r.DOC_COGN.strip() for r in rr})
+        classes = sorted({c for r in rr for c in class_codes(r.CLASSE)})
+        rows.append([mat, mat_names.get(mat, rr[-1].MAT_NOME), hours,
+                     " ".join(profs), " ".join(classes)])
+    return rows
+
+def write_subject_sheet(sheet, fmt, rows):
+    sheet.set_column(0, 0, 10)
+    sheet.set_column(1, 1, 25)
+    sheet.set_column(3, 4, 60)
+    sheet.write_row(0, 0, ["Codice", "Materia", "Ore", "Docenti", "Classi"],
+                    fmt["header"])
+    for row, data in enumerate(rows, 1):
+        sheet.write_row(row, 0, data)
+
+# the whole workbook ----------------------------------------------------
+
+# Instead of one workbook per program, each one with its own formats
+# and its own reading of the data, here all the sheets (full
+# timetable, classes, rooms, subjects and the workload of teachers and
+# classes) are written in one workbook, from the same Timetable and
+# with the same formats.
+
+def write_workbook(csv_in, xls_out="out/timetable.xlsx",
+                   manifest=None, jobs=1):
+
+    tt = load_timetable(csv_in)
+
+    if manifest is not None:
+        keys = dict()
+        for kind, kk in (("prof", prof_dict_hashes(tt.prof_dict)),
+                         ("class", class_hashes(tt.classes)),
+                         ("room", room_hashes(tt.rooms))):
+            keys.update({f"{kind} {entity_name(k)}": v for k, v in kk.items()})
+        key = inputs_hash(sorted(keys.items()), DELETE_MATTER, MERGE_CELLS,
+                          subject_rows(tt.subject_dict))
+        if MERGE_CELLS:
+            key = inputs_hash(key, sorted(tt.teachers.spans().items()),
+                              sorted(tt.rooms.spans().items()))
+        if not manifest.stale(xls_out, key):
+            debug(f"Output XLS file '{xls_out}' is up to date")
+            return
+        manifest.update(xls_out, key, keys)
+
+    debug(f"Writing output XLS file '{xls_out}'")
+    with stage("render"):
+        prof_rows = prof_dict_rows(tt.prof_dict, jobs)
+        arrays = class_sheet_arrays(tt.classes, jobs)
+        rooms = room_rows(tt.rooms)
+        subjects = subject_rows(tt.subject_dict)
+        prof_load = workload_rows(tt.workload("teachers"))
+        class_load = workload_rows(tt.workload("classes"))
+        prof_spans = room_spans = None
+        if MERGE_CELLS:
+            prof_spans = grid_spans(tt.teachers.spans(), sorted(tt.prof_dict))
+            room_spans = grid_spans(tt.rooms.spans(), tt.rooms.names)
+    with stage("write"):
+        book = xlsxwriter.Workbook(xls_out, {"constant_memory": True})
+        fmt = make_formats(book)
+        write_grid_sheet(book.add_worksheet("Orario"), fmt, "Orario",
+                         prof_rows, prof_spans)
+        write_class_sheet(book.add_worksheet("Classi"), fmt, arrays)
+        write_grid_sheet(book.add_worksheet("Aule"), fmt, "Aule", rooms,
+                         room_spans)
+        write_subject_sheet(book.add_worksheet("Materie"), fmt, subjects)
+        write_workload_sheet(book.add_worksheet("Carico docenti"), fmt,
+                             "Docenti", prof_load)
+        write_workload_sheet(book.add_worksheet("Carico classi"), fmt,
+                             "Classi", class_load)
+        book.close()
 
 # code specific to odv-class-timetable --------------------
 
@@ -489,20 +1548,8 @@ def get_mat_names(input="data/mat_names.txt"):
             MAT_NAMES[k] = v
     return MAT_NAMES
 
-
-def start_sorter(r):
-    return r.ORA_PROG
-
-def day_sorter(d):
-    return DAYS_INDEX[d[0]]
-
 def make_class_timetable_array(klass, lessons):
 
-    # Load abbreviations for subjects: "Inglese" instead "Lingua e
-    # Cultura Straniera Inglese" as description for ING).
-
-    mat_names = get_mat_names()
-
     # print(f"\n=== {klass} ====================")
     rr = list()
     # dd = ["Ora"] + [d[:3].upper() for d in DAYS_SHIFT]
@@ -534,47 +1581,19 @@ def make_class_timetable_array(klass, lessons):
     hh = [""] + list(END_TIMES.values())
     rr.append(hh)
 
-    for day, lessons in sorted(lessons.items(), key=day_sorter):
+    # LESSONS has, for each slot of the week, the tuple of the lessons
+    # (records) of the class in that slot (see Occupancy.cells).
+
+    for d, day in enumerate(DAYS_SHIFT):
         r = [day.capitalize()]
-        # BUG:
-        # Here I'm looping on lessons but it is important to also
-        # produce lines (hour) where this class has no lesson (e.g.:
-        # this class start the day with the second hour on monday).
-        # for o in sorted(lessons, key=start_sorter):
-        #     mat = mat_names[o.MAT_COD]             # ING -> Inglese
-        #     r.append(f"{mat.strip()}\n{o.DOC_COGN.strip()}")
-
-        foo = ordereddict()
-        # for st in START_TIMES:  # prefill with all start times!
-        #     foo[st] = None
-        # for less in lessons:
-        #     foo[less.ORA_INIZIO] = less
-        for st in START_TIMES:  # prefill with all start times!
-            foo[st] = list()
-        for less in lessons:
-            foo[less.ORA_INIZIO].append(less)
-
-        for index, (st, oo) in enumerate(foo.items()):
+        for oo in lessons[d * LESSONS_PER_DAY:(d + 1) * LESSONS_PER_DAY]:
             if not oo:           # no lessons at this time
                 r.append("")
             else:
-                mm = list()
-                try:
-                    for o in oo:
-                        mat = mat_names[o.MAT_COD]             # ING -> Inglese
-                        mat = o.MAT_COD # .capitalize()
-                        mm.append(mat)
-                except KeyError as e:
-                    foo = f"{index=},{o.MAT_COD=},{o.DOC_NOME=}"
-                    debug(f"make_class_timetable_array ({foo}) {e}")
-                    continue
-                mat = "/".join(mm).strip()
+                mat = "/".join(o.MAT_COD for o in oo).strip()
                 # if len(oo) > 1:
                 #     debug(f"MULTIPLE {mat}")
-                pp = list()
-                for o in oo:
-                    pp.append(o.DOC_COGN.strip())
-                prof = "/".join(pp)
+                prof = "/".join(o.DOC_COGN.strip() for o in oo)
                 # BUG: single MAT only ???
                 r.append(f"{mat}\n{prof}\nsincrona")
         rr.append(r)
@@ -585,64 +1604,502 @@ def make_class_timetable_array(klass, lessons):
     rr.insert(1, kk)
     return rr
 
-def write_class_time_table_xls(csv_in, xls_out="out/class-timetable.xls"):
+def class_hashes(classes):
+    return {k: inputs_hash(k, [[tuple(r) for r in oo] for oo in classes.cells(k)])
+            for k in classes.names}
 
-    # https://xlsxwriter.readthedocs.io/format.html#set_align
-    debug(f"Writing output XLS file '{xls_out}'")
-    book = xlsxwriter.Workbook(xls_out)
-    wrap_text = book.add_format()
-    wrap_text.set_text_wrap()
-    wrap_text.set_align("center")
-    wrap_text.set_align("vcenter")
+def class_timetable_array(item):
+    return make_class_timetable_array(*item)
 
-    recs = csv_to_records(csv_in)
-    class_dict = records_to_class_dict(recs)
-    lessons_dict = defaultdict(list)
+def write_class_time_table_xls(csv_in, xls_out="out/class-timetable.xls",
+                               manifest=None, jobs=1):
 
-    sheet = book.add_worksheet()
-    sheet.set_default_row(44)
-    sheet.set_column(1, 6, 15)
+    # CSV_IN can also be an already loaded Timetable (see below).
 
-    # Reorganize date from class_dict (that uses classes as keys) to
-    # lessons_dict (that uses days as keys).  Both use records a
-    # values.
+    classes = load_timetable(csv_in).classes
 
-    for klass, recs in sorted(class_dict.items()):
-        day_lessons = defaultdict(list)
-        lessons_dict[klass] = day_lessons
-        for r in recs:
-            day_lessons[r.GIORNO].append(r)
+    if manifest is not None:
+        keys = class_hashes(classes)
+        key = inputs_hash(sorted(keys.items()))
+        if not manifest.stale(xls_out, key):
+            debug(f"Output XLS file '{xls_out}' is up to date")
+            return
+        manifest.update(xls_out, key, keys)
 
-    # Load abbreviations for subjects: "Inglese" instead "Lingua e
-    # Cultura Straniera Inglese" as description for ING).
+    debug(f"Writing output XLS file '{xls_out}'")
+    with stage("render"):
+        arrays = class_sheet_arrays(classes, jobs)
+    with stage("write"):
+        book = xlsxwriter.Workbook(xls_out, {"constant_memory": True})
+        fmt = make_formats(book)
+        write_class_sheet(book.add_worksheet(), fmt, arrays)
+        book.close()
 
-    mat_names = get_mat_names()
+def class_sheet_arrays(classes, jobs=1):
+    return parallel_map(class_timetable_array,
+                        [(k, classes.cells(k)) for k in classes.names],
+                        jobs)
+
+def write_class_sheet(sheet, fmt, arrays):
+
+    # https://xlsxwriter.readthedocs.io/format.html#set_align
+    # (il formato "wrap" va a capo e centra il testo nelle celle)
+    # ARRAYS sono le tabelle delle classi (vedi class_sheet_arrays).
+
+    sheet.set_default_row(44)
+    sheet.set_column(1, 6, 15)
 
     row_index = 0
-    for klass, lessons in sorted(lessons_dict.items()):
+    for out in arrays:                  # sorted by class
         sheet.write(row_index, 0, "")
         row_index += 1
-        out = make_class_timetable_array(klass, lessons)
         for r in out:
             if not any (r[1:]):
                 continue
-            for col_index, s in enumerate(r):
-                sheet.write(row_index, col_index, s, wrap_text)
+            sheet.write_row(row_index, 0, r, fmt["wrap"])
             row_index += 1
 
-    book.close()
+# html pages ------------------------------------------------------
+
+# The HTML tables (one per class, teacher or room) all have the same
+# shape: one row per hour, one column per day and two lines of text in
+# each cell.  So the template of a row is "compiled" once, here, in a
+# single format string with all the cells, and each page is assembled
+# joining the rows, with no string concatenation in loops.
+
+HTML_TABLE = r"""
+
+<table border="1">
+  <tr>
+    <td align="center" colspan="7" bold="1">%(title)s</td>
+  </tr>
+  <tr>
+    <th></th>
+    <th>Lun</th><th>Mar</th><th>Mer</th>
+    <th>Gio</th><th>Ven</th><th>Sab</th>
+  </tr>
+
+  %(rows)s
+</table>
+
+"""
+
+HTML_ROW = ("  <tr>\n    <td>%s</td>" +
+            '  <td align="center">%s</br>%s</td>' * DAYS_PER_WEEK +
+            "\n  </tr>\n")
+
+# A whole "site" in a single page: an index with links to all the
+# tables, grouped by kind (classes, teachers, rooms), and then the
+# tables themselves.
+
+HTML_PAGE = r"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+</head>
+<body>
+<h1>%(title)s</h1>
+%(index)s
+%(body)s
+</body>
+</html>
+"""
+
+def html_text(s):
+    return html.escape(str(s), quote=False)
+
+def html_rows(grid):
+
+    # GRID has one row per hour, with one cell per day: a pair of
+    # strings (the two lines) or "" if there's no lesson.
+
+    values = list()
+    for ri, row in enumerate(grid):
+        vv = [START_TIMES[ri]]
+        for cell in row:
+            vv.extend(map(html_text, cell) if cell else ("", ""))
+        values.append(HTML_ROW % tuple(vv))
+    return "".join(values)
+
+def html_table(title, grid):
+    return HTML_TABLE % {"title": html_text(title), "rows": html_rows(grid)}
+
+def html_id(kind, name):
+    return f"{kind}-{safe_file_name(name)}"
+
+def html_site(title, sections):
+
+    # SECTIONS = [(kind, [(name, table), ...]), ...]
+
+    index = list()
+    body = list()
+    for kind, tables in sections:
+        links = " ".join(f'<a href="#{html_id(kind, n)}">{html_text(entity_name(n))}</a>'
+                         for n, _ in tables)
+        index.append(f"<h2>{html_text(kind.capitalize())}</h2>\n<p>{links}</p>\n")
+        body.extend(f'<div id="{html_id(kind, n)}">{t}</div>\n'
+                    for n, t in tables)
+    return HTML_PAGE % {"title": html_text(title),
+                        "index": "".join(index),
+                        "body": "".join(body)}
+
+# A volte il "codice della classe" è qualcosa del tipo "2G/H SPA", che
+# come stringa da utilizzare nel nome di un file non è proprio il
+# massimo!  (E i nomi delle aule sono anche peggio...)
+
+def safe_file_name(name):
+    name = entity_name(name)
+    name = name.replace("/", "-")
+    name = name.replace(" ", "_")
+    return "".join(c for c in name if c.isalnum() or c in "-_.,")
+
+# The grids of the tables come straight from the occupancy matrices:
+# CELL gets the records of the lessons in a slot and returns the two
+# lines of text of the cell.
+
+def occupancy_grid(occ, name, cell):
+    grid = [[""] * DAYS_PER_WEEK for h in range(LESSONS_PER_DAY)]
+    row = occ.row(name)
+    for slot in np.flatnonzero(row != FREE):
+        d, h = divmod(int(slot), LESSONS_PER_DAY)
+        grid[h][d] = cell(occ.group(row[slot]))
+    return grid
+
+def class_html_cell(oo):                # subject / teacher
+    return ("/".join(o.MAT_COD for o in oo),
+            "/".join(o.DOC_COGN.strip() for o in oo))
+
+def prof_html_cell(oo):                 # class / subject
+    return ("/".join(clean_cell(o.CLASSE) for o in oo),
+            "/".join(o.MAT_COD for o in oo))
+
+def room_html_cell(oo):                 # class / teacher
+    return ("/".join(clean_cell(o.CLASSE) for o in oo),
+            "/".join(o.DOC_COGN.strip() for o in oo))
+
+# the parsed timetable --------------------------------------------
+
+# All the programs start from the same export file and then build one
+# or more "views" of the same data: by prof (the full timetable), by
+# class, by room, by subject.  A Timetable reads the file once and
+# computes each view only the first time it is needed, keeping it for
+# any later use.  So, producing all the outputs for a publication
+# costs one parse, not one per program.
+
+class Timetable:
+
+    def __init__(self, records, source=None, pairs=None):
+        self.records = tuple(records)
+        self.source = source
+        self.pairs = pairs              # see load_prof_pairs_dic
+        self._views = dict()
+
+    @classmethod
+    def from_csv(cls, csv_in):
+        return cls(staged("parse", csv_to_records(csv_in)), csv_in)
+
+    @classmethod
+    def from_sqlite(cls, src):
+        # SRC = "file.sqlite" (the last export) or "file.sqlite#WHICH"
+        db, _, which = src.partition("#")
+        with stage("read"):
+            records, pairs = sqlite_records(db, which or None)
+        return cls(records, src, pairs)
+
+    @cached_property
+    def store(self):
+        with stage("expand"):
+            return RecordStore(self.records)
+
+    @cached_property
+    def slots(self):
+        starts, sizes = self.store.slots()
+        count("lessons", int(sizes.sum()))
+        return starts, sizes
+
+    # FUNC gets a value of FIELD and returns the tuple of keys of the
+    # entities (teachers, classes, ...) of the records with that value.
+
+    def symbols(self, field, func):
+        codes, symbols = self.store.codes(field)
+        with stage("expand"):
+            return codes, [func(s) for s in symbols]
+
+    def symbol_occupancy(self, field, func):
+        codes, keys = self.symbols(field, func)
+        with stage("aggregate"):
+            return make_symbol_occupancy(self.records, codes, keys,
+                                         *self.slots)
+
+    @cached_property
+    def teachers(self):
+
+        # I dati delle varie righe vengono raccolti per docente, usando
+        # come chiave la coppia cognome/nome.
+
+        # Manini: 19 marzo 2021 (sic!)
+        # -------------------------------------------------------------
+        # Ogni tanto al posto di un nome di docente ce ne sono
+        # due, come si può vedere da questi messaggi di debug
+        # (precedenti al fix!). In quel caso, al posto del cognome
+        # ci sono i due cognomi (che geni!) e al posto dei nomi i
+        # due nomi (almeno coerenti!).
+        # -------------------------------------------------------------
+        # DEBUG: prof_cod = ('Gruber', 'Evelin')
+        # DEBUG: prof_cod = ('Gruber, Valduga', 'Evelin, Gianluca')
+        # DEBUG: prof_cod = ('Gubert', 'Chiara')
+        # DEBUG: prof_cod = ('Gubert, Nanut', 'Chiara, Michela')
+        # -------------------------------------------------------------
+        # La funzione clean_prof_cod si occupa di mettere tutto a posto!
+
+        if self.pairs is None:
+            self.pairs = load_prof_pairs_dic()
+        pairs = self.pairs
+        return self.symbol_occupancy(("DOC_COGN", "DOC_NOME"),
+                                     lambda p: (clean_prof_cod(p, pairs),))
+
+    @cached_property
+    def class_symbols(self):
+        codes, keys = self.symbols("CLASSE", class_codes)
+        multi = np.array([len(kk) > 1 for kk in keys], dtype=bool)
+        count("multiclass_rows", int(np.count_nonzero(multi[codes])))
+        return codes, keys
+
+    @cached_property
+    def class_keys(self):
+        codes, keys = self.class_symbols
+        return [keys[c] for c in codes]
+
+    @cached_property
+    def classes(self):
+        codes, keys = self.class_symbols
+        with stage("aggregate"):
+            return make_symbol_occupancy(self.records, codes, keys,
+                                         *self.slots)
+
+    @cached_property
+    def rooms(self):
+        return self.symbol_occupancy("AULA", lambda a: (a,) if a else ())
+
+    @cached_property
+    def clashes(self):
+        self.teachers, self.classes, self.rooms # timed as "aggregate"
+        with stage("check"):
+            return find_clashes(self)
+
+    @cached_property
+    def prof_dict(self):
+        self.teachers                   # timed as "aggregate"
+        with stage("aggregate"):
+            return occupancy_to_prof_dict(self.teachers)
+
+    @cached_property
+    def subject_dict(self):
+        with stage("aggregate"):
+            return records_to_subject_dict(self.records)
+
+    # Free/busy bitmasks (see Availability) of KIND: "teachers",
+    # "classes" or "rooms".
+
+    def availability(self, kind):
+        key = ("availability", kind)
+        if key not in self._views:
+            occ = getattr(self, kind)
+            with stage("aggregate"):
+                self._views[key] = Availability.from_occupancy(occ)
+        return self._views[key]
+
+    # Hours, gaps and longest runs (see Workload) of KIND, as above.
+
+    def workload(self, kind):
+        key = ("workload", kind)
+        if key not in self._views:
+            occ = getattr(self, kind)
+            with stage("aggregate"):
+                self._views[key] = Workload.from_occupancy(occ)
+        return self._views[key]
+
+# Programs' entry points accept either the path of an export file (or
+# of a SQLite store, see below) or an already loaded Timetable.
+
+def load_timetable(src):
+    if isinstance(src, Timetable):
+        return src
+    if is_sqlite(src):
+        return Timetable.from_sqlite(src)
+    return Timetable.from_csv(src)
+
+# Programs that need just one pass over the records (like
+# odv-base-tables) don't need the whole Timetable either: records
+# from an export file are parsed one at a time while they are used.
+
+def iter_records(src):
+    if isinstance(src, Timetable):
+        return iter(src.records)
+    if is_sqlite(src):
+        db, _, which = src.partition("#")
+        return iter(sqlite_records(db, which or None)[0])
+    return staged("parse", csv_to_records(src))
+
+# sqlite store ----------------------------------------------------
+
+# Every question about the data meant a new loop over a reparsed
+# export.  Many exports (a whole year of them) can instead be imported
+# (see odv-sqlite.py) in a SQLite database and then questions become
+# queries.  The "records" table has the raw fields of each export, so
+# that the Timetable can be rebuilt (and all the writers can read from
+# the database: just give "out/timetable.sqlite" or, for an older
+# export, "out/timetable.sqlite#ID" as the export file).  The "slots"
+# table has one row for each hour of each lesson of each teacher
+# (pairs resolved), class (multiclass rows split) and room, the same
+# as the occupancy matrices, and the *_lessons views join them
+# together with the names of days and hours.  The teacher pairs used
+# for each export are kept too, they may change from one to the next.
+
+SQLITE_FILE = "out/timetable.sqlite"
+SQLITE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+SQLITE_KINDS = (("teacher", "teachers"), ("class", "classes"),
+                ("room", "rooms"))
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    id INTEGER PRIMARY KEY, source TEXT, sha1 TEXT UNIQUE,
+    imported TEXT, rows INTEGER);
+CREATE TABLE IF NOT EXISTS records (
+    export INTEGER REFERENCES exports(id), record INTEGER, %(fields)s,
+    PRIMARY KEY (export, record)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS times (
+    slot INTEGER PRIMARY KEY, day INTEGER, hour INTEGER,
+    day_name TEXT, start TEXT);
+CREATE TABLE IF NOT EXISTS slots (
+    export INTEGER, kind TEXT, name TEXT, slot INTEGER, record INTEGER);
+CREATE TABLE IF NOT EXISTS prof_pairs (
+    export INTEGER, first TEXT, second TEXT, choice TEXT);
+CREATE INDEX IF NOT EXISTS slots_name ON slots (kind, name, export, slot);
+CREATE INDEX IF NOT EXISTS slots_time ON slots (export, slot, kind);
+"""
+
+SQLITE_VIEW = """
+CREATE VIEW IF NOT EXISTS %(kind)s_lessons AS
+    SELECT s.export, s.name AS %(kind)s, t.day, t.hour, t.day_name,
+           t.start, %(fields)s
+    FROM slots s JOIN times t USING (slot)
+    JOIN records r ON r.export = s.export AND r.record = s.record
+    WHERE s.kind = '%(kind)s';
+"""
+
+def is_sqlite(src):
+    return (isinstance(src, str) and
+            src.partition("#")[0].endswith(SQLITE_SUFFIXES))
+
+def sqlite_connect(db=None):
+    db = db or SQLITE_FILE
+    os.makedirs(os.path.dirname(db) or ".", exist_ok=True)
+    import sqlite3
+    con = sqlite3.connect(db)
+    fields = Record.__fields__
+    con.executescript(SQLITE_SCHEMA % {"fields": ", ".join(
+        f"{f} TEXT" for f in fields)})
+    for kind, _ in SQLITE_KINDS:
+        con.executescript(SQLITE_VIEW % {"kind": kind, "fields": ", ".join(
+            f"r.{f}" for f in fields)})
+    days = list(DAYS_SHIFT)
+    con.executemany("INSERT OR IGNORE INTO times VALUES (?, ?, ?, ?, ?)",
+                    [(d * LESSONS_PER_DAY + h, d, h, days[d], START_TIMES[h])
+                     for d in range(DAYS_PER_WEEK)
+                     for h in range(LESSONS_PER_DAY)])
+    con.commit()
+    return con
+
+def sqlite_imported(con, sha1):
+    # the id of the export with SHA1 (of the file content), or None
+    row = con.execute("SELECT id FROM exports WHERE sha1 = ?",
+                      (sha1,)).fetchone()
+    return row and row[0]
+
+def sqlite_import(con, tt, source=None, sha1=None):
+
+    # Adds the Timetable TT and returns the id of its export; an export
+    # with the same SHA1 (of the file content) is not imported again.
+
+    if sha1 is not None:
+        export = sqlite_imported(con, sha1)
+        if export is not None:
+            debug(f"{_me()}: '{source}' already imported as {export}")
+            return export
+    with con:                           # one transaction
+        cur = con.execute(
+            "INSERT INTO exports (source, sha1, imported, rows) "
+            "VALUES (?, ?, datetime('now'), ?)",
+            (source, sha1, len(tt.records)))
+        export = cur.lastrowid
+        n = len(Record.__fields__)
+        con.executemany(
+            f"INSERT INTO records VALUES (?, ?{', ?' * n})",
+            ((export, i, *r) for i, r in enumerate(tt.records)))
+        for kind, attr in SQLITE_KINDS:
+            occ = getattr(tt, attr)
+            names = [entity_name(k) for k in occ.names]
+            con.executemany(
+                "INSERT INTO slots VALUES (?, ?, ?, ?, ?)",
+                ((export, kind, names[e], int(s), int(r))
+                 for e, s, r in zip(*occ.triples())))
+        con.executemany("INSERT INTO prof_pairs VALUES (?, ?, ?, ?)",
+                        ((export, first, second, choice)
+                         for (first, second), choice in tt.pairs.items()))
+    debug(f"{_me()}: '{source}' imported as {export}")
+    return export
+
+def sqlite_export_id(con, which=None):
+
+    # WHICH is the id, a prefix of the SHA1 or the source of an
+    # export; None means the last one imported.
+
+    if which is None:
+        row = con.execute("SELECT max(id) FROM exports").fetchone()
+    elif which.isdigit():
+        row = con.execute("SELECT id FROM exports WHERE id = ?",
+                          (int(which),)).fetchone()
+    else:
+        row = con.execute("SELECT max(id) FROM exports WHERE sha1 LIKE ? "
+                          "OR source = ?", (which + "%", which)).fetchone()
+    if not row or row[0] is None:
+        raise ValueError(f"No export '{which or ''}' in the database")
+    return row[0]
+
+def sqlite_records(db, which=None):
+    # (records, pairs) of an export, see sqlite_export_id
+    if not os.path.exists(db):
+        raise FileNotFoundError(f"No such database: '{db}'")
+    con = sqlite_connect(db)
+    try:
+        export = sqlite_export_id(con, which)
+        rows = con.execute("SELECT * FROM records WHERE export = ? "
+                           "ORDER BY record", (export,))
+        records = [make_record(intern_row(list(r[2:]))) for r in rows]
+        pairs = ProfPairs(((first, second), choice) for first, second, choice
+                          in con.execute("SELECT first, second, choice FROM "
+                                         "prof_pairs WHERE export = ?",
+                                         (export,)))
+    finally:
+        con.close()
+    debug(f"{_me()}: {len(records)} records of export {export} from '{db}'")
+    count("rows", len(records))
+    return records, pairs
 
 if __name__ == "__main__":
 
-    import sys
-    import os
     progname = os.path.basename(__file__)
 
     def usage():
-        print(f"usage: {progname} export-csv-file")
+        print(f"usage: {progname} [--jobs N] [--profile] [--cprofile] "
+              f"export-csv-file")
 
-    import sys
     args = sys.argv[1:]
+    setup_logging()
+    jobs = int(pop_option(args, "--jobs", 1))
+    pop_profile(args)
     if len(args) > 1:
         usage()
         sys.exit(1)
@@ -651,5 +2108,7 @@ if __name__ == "__main__":
         sys.exit(0)
     csv_in = args and args[0] or CSV_INPUT
 
-    write_class_time_table_xls(csv_in)
+    manifest = Manifest()
+    write_class_time_table_xls(csv_in, manifest=manifest, jobs=jobs)
+    manifest.save()
     # class_time_table(csv_in)
@@ -1,90 +1,104 @@
 # -*- coding: utf-8 -*-
 
 import os
+from array import array
 from collections import defaultdict
+from functools import lru_cache
 import logging
 info = logging.info
-logging.basicConfig(level=logging.INFO,
-                    format="%(levelname)s: %(message)s")
 
-def file_to_rows(file, skip_first_line=True):
-    """Read FILE, split on semicolons."""
+from odv import (
+    setup_logging, iter_records, pop_profile, stage,
+    class_codes, room_parts, prof_names,
+    )
+
+OUTDIR = "simple-out"
+
+def file_to_rows(file):
+    """Read FILE (or reuse a loaded Timetable), yield its records."""
     info(f"Reading '{file}'")
-    start = 1 if skip_first_line else 0
-    data = open(file).readlines()[start:]
-    rows = [s.split(";") for s in data]
-    info(f"Read {len(rows)} lines")
-    return rows
+    n = 0
+    for n, r in enumerate(iter_records(file), 1):
+        yield r
+    info(f"Read {n} lines")
 
+# The "fixes" use the shared (and cached) normalization of odv, see
+# odv.class_codes & C.
+
+@lru_cache(maxsize=None)
 def fix_prof(surname, name):
-    ss = surname.split(",")
-    if len(ss) > 1:
-        surname = ss[0].strip()
-        name = name.split(",")[0].strip()
+    pp = prof_names(surname, name)
+    if len(pp) > 1:
+        surname, name = pp[0]
     surname = surname.replace("e'", "è")
     return surname, name
 
 def fix_room(room):
-    try:
-        k = room.split("(")[0]
-        return k
-        r = k.split(")")[1]
-        return f"{room} === {k} --- {r}"
-    except IndexError as e:
-        raise Exception(f"{room = } {k = } {e}")
+    return room_parts(room)[0]
 
 def fix_class(klass):
-    klass = klass.strip("sa")
-    if not "[" in klass:
-        return [klass]
-    klass = klass.strip("[]").split()[0]
-    o = klass[0]
-    ss = klass[1:].split("/")
-    return [o + s for s in ss]
+    return class_codes(klass)
 
-def calc_summaries(rows):
-    """Collect selected fields from ROWS and fill given collections"""
-    info("Calculating summaries")
+def fixed_rows(rows):
+    """Yield (classes, prof, room, mat_cod, mat_name, day, start) for ROWS"""
 
-    cc_dic = defaultdict(set)
-    klass_set = set()
-    mat_dic = dict()
-    prof_tt = defaultdict(list)
-    prof_set = set()
-    room_set = set()
+    # The fixes depend on the row only, not on the class (a multiclass
+    # row has more than one), so they are done once per row.
 
     multi_class = 0
     for r in rows:
-
-        (num, duration, freq,
-         mat_cod, mat_name,
-         prof_surname, prof_name,
-         klass,
-         room,
-         _period, _spec, _co_doc, _coeff,
-         day, start, _studs) = r
-
-        kk = fix_class(klass)
+        kk = fix_class(r.CLASSE)
         if len(kk) > 1:
             multi_class += 1
+        yield (kk, fix_prof(r.DOC_COGN, r.DOC_NOME), fix_room(r.AULA),
+               r.MAT_COD, r.MAT_NOME, r.GIORNO, r.ORA_INIZIO)
+    info(f"{multi_class} multi-class records found")
 
-        for k in kk:
+class ProfTT:
 
-            prof_surname, prof_name = fix_prof(prof_surname, prof_name)
-            prof_set.add((prof_surname, prof_name))
+    """Lessons (day, start, mat_cod) of each prof, in file order"""
 
-            klass_set.add(k)
+    # Each distinct lesson is kept once, each prof has just an array
+    # of their codes: a few bytes per row instead of a tuple.
 
-            mat_dic[mat_cod] = mat_name
+    def __init__(self):
+        self.codes = dict()             # (day, start, mat) -> code
+        self.lessons = list()           # code -> (day, start, mat)
+        self.profs = defaultdict(lambda: array("I"))
 
-            room = fix_room(room)
-            room_set.add(room)
+    def append(self, prof, lesson):
+        code = self.codes.get(lesson)
+        if code is None:
+            code = self.codes[lesson] = len(self.lessons)
+            self.lessons.append(lesson)
+        self.profs[prof].append(code)
 
-            cc_dic[k.strip()].add((prof_surname, mat_cod))
+    def __len__(self):
+        return len(self.profs)
 
-            prof_tt[(prof_surname, prof_name)].append((day,start,mat_cod))
+    def items(self):
+        for k, cc in self.profs.items():
+            yield k, [self.lessons[c] for c in cc]
 
-    info(f"{multi_class} multi-class records found")
+def calc_summaries(rows):
+    """Collect selected fields from ROWS and fill given collections"""
+    info("Calculating summaries")
+
+    cc_dic = defaultdict(set)
+    klass_set = set()
+    mat_dic = dict()
+    prof_tt = ProfTT()
+    prof_set = set()
+    room_set = set()
+
+    for kk, prof, room, mat_cod, mat_name, day, start in fixed_rows(rows):
+        prof_set.add(prof)
+        mat_dic[mat_cod] = mat_name
+        room_set.add(room)
+        for k in kk:                    # none if CLASSE is malformed
+            klass_set.add(k)
+            cc_dic[k.strip()].add((prof[0], mat_cod))
+            prof_tt.append(prof, (day, start, mat_cod))
 
     return {
         "Profs": prof_set,
@@ -95,66 +109,83 @@ def calc_summaries(rows):
         "Prof_TT": prof_tt,
     }
 
-def string_collection(oo, name, limit=1000):
+# The files are written a line at a time, never building the whole
+# text in memory.
+
+def write_joined(out, lines):
+    """The same as OUT.write("\\n".join(LINES)), a line at a time"""
+    sep = ""
+    for s in lines:
+        out.write(sep + s)
+        sep = "\n"
+
+def collection_lines(oo, name, limit=1000):
     """Show contents of OO and LEN of collections, prefix with NAME"""
     if isinstance(oo, dict):
         oo = oo.items()
+    yield f"{name}: {len(oo)}"
     ss = list()
-    for o in list(oo)[:limit]:
+    for o in oo:
+        if len(ss) == limit:
+            break
         ss.append(str(o))
-    ss.sort()
-    ss.insert(0, f"{name}: {len(oo)}")
-    return "\n".join(ss)
+    yield from sorted(ss)
 
-def string_cc(cc):
-    ss = list()
+def cc_lines(cc):
     for k,pp in sorted(cc.items()):
-        ss.append(f"\n{k}")
+        yield f"\n{k}"
         for p,m in sorted(pp):
-            ss.append(f"    {p:20s} {m:3s}")
-    return "\n".join(ss)
-
-def save_cc(cc):
-    f = f"simple-out/cc.txt"
+            yield f"    {p:20s} {m:3s}"
+
+def prof_tt_lines(cc):
+    for k,vv in sorted(cc.items()):
+        yield f"\n{' '.join(k)}\n"
+        for v in vv:
+            day,time,mat = v
+            day = day.upper()[:3]
+            time = time.replace("h", ":").lstrip("0")
+            s = "%s %5s %s" % (day,time,mat)
+            yield f"   {s}\n"
+
+def save_cc(cc, outdir=OUTDIR):
+    f = os.path.join(outdir, "cc.txt")
     info(f"Saving {len(cc)} CC lines to '{f}'")
-    with open(f, "w") as out:
-        s = string_cc(cc)
-        out.write(s)
+    with stage("write"), open(f, "w") as out:
+        write_joined(out, cc_lines(cc))
 
-def save_prof_tt(cc):
-    f = f"simple-out/prof_tt.txt"
+def save_prof_tt(cc, outdir=OUTDIR):
+    f = os.path.join(outdir, "prof_tt.txt")
     info(f"Saving {len(cc)} prof timetable lines to '{f}'")
-    with open(f, "w") as out:
-        for k,vv in sorted(cc.items()):
-            out.write(f"\n{' '.join(k)}\n")
-            for v in vv:
-                day,time,mat = v
-                day = day.upper()[:3]
-                time = time.replace("h", ":").lstrip("0")
-                s = "%s %5s %s" % (day,time,mat)
-                out.write(f"   {s}\n")
+    with stage("write"), open(f, "w") as out:
+        out.writelines(prof_tt_lines(cc))
 
-def save_summaries(rows):
+def save_summaries(rows, outdir=OUTDIR):
 
-    data = calc_summaries(rows)
+    with stage("aggregate"):
+        data = calc_summaries(rows)
 
     info("Saving summaries...")
     for s,c in data.items():
-        f = f"simple-out/{s.lower()}.txt"
+        f = os.path.join(outdir, f"{s.lower()}.txt")
         info(f"...writing {len(c)} lines to '{f}'")
         if s == "CC":
-            save_cc(c)
+            save_cc(c, outdir)
         elif s == "Prof_TT":
-            save_prof_tt(c)
+            save_prof_tt(c, outdir)
         else:
-            with open(f, "w") as out:
-                out.write(string_collection(c, s))
+            with stage("write"), open(f, "w") as out:
+                write_joined(out, collection_lines(c, s))
 
-def main(input_csv_file):
+def main(input_csv_file, outdir=OUTDIR):
 
+    os.makedirs(outdir, exist_ok=True)
     rows = file_to_rows(input_csv_file)
-    save_summaries(rows)
+    save_summaries(rows, outdir)
 
 if __name__ == "__main__":
 
-    main("data/export.csv")
+    import sys
+    args = sys.argv[1:]
+    setup_logging(logging.INFO)
+    pop_profile(args)                   # --profile, --cprofile
+    main(args and args[0] or "data/export.csv")